@@ -10,6 +10,7 @@ import requests
 import websocket
 
 import services as service
+from api import decoder
 from api.errors import Error
 from api.init import Setup
 from api.variables import Variables
@@ -35,6 +36,7 @@ class Bitmex(Variables):
         self.object = Bitmex
         self.name = "Bitmex"
         self.data = dict()
+        self.symbols = dict()
         self.Api_auth = API_auth
         Setup.variables(self)
         self.session = requests.Session()
@@ -167,10 +169,8 @@ class Bitmex(Variables):
             tm += sl
             sleep(sl)
         del self.unsubscribe[symb]
-        if symbol in self.data["instrument"]:
-            del self.data["instrument"][symbol]
-        if symbol in self.data[self.depth]:
-            del self.data[self.depth][symbol]
+        self.symbols["instrument"].discard(symbol)
+        self.symbols[self.depth].discard(symbol)
         if (self.user_id, symb, self.name) in self.data["position"]:
             del self.data["position"][(self.user_id, symb, self.name)]
 
@@ -233,8 +233,7 @@ class Bitmex(Variables):
             count += 1
             if count > 30:  # fails after 3 seconds
                 instr_lack = symbol_list.copy()
-                for instrument in self.data["instrument"].values():
-                    symb = (instrument["symbol"], self.name)
+                for symb in self.symbols["instrument"]:
                     if symb in symbol_list:
                         instr_lack.remove(symb)
                 self.logger.info(
@@ -245,12 +244,51 @@ class Bitmex(Variables):
                 return "error"
             num = 0
             for symbol in symbol_list:
-                if symbol in self.data["instrument"].keys():
+                if symbol in self.symbols["instrument"]:
                     num += 1
             if num == len(symbol_list):
                 return ""
             sleep(0.1)
 
+    def _store(self, table: str, key: tuple, val: dict) -> None:
+        """
+        Keeps the row in the mirror of the table. Orders that are already
+        filled or cancelled are not kept, and open orders are removed when
+        they are closed, so the order mirror holds only live orders. The
+        other mirrored tables have a row per symbol or currency.
+        """
+        if table == "order" and val.get("leavesQty", 0) <= 0:
+            self.data[table].pop(key, None)
+        else:
+            self.data[table][key] = val
+
+    def __on_fast_table(self, table: str, action: str, message: dict) -> None:
+        """
+        The orderBook10, quote and instrument tables arrive at a high rate
+        and are applied straight to Instrument. Instead of a mirror of their
+        rows only the set of received symbols is kept, which is used to
+        ignore updates of symbols without a partial and to confirm
+        subscriptions.
+        """
+        if action == "partial":
+            self.keys[table] = message["keys"]
+        symbols = self.symbols[table]
+        for val in message["data"]:
+            symbol = (val["symbol"], self.name)
+            if action == "partial" or action == "insert":
+                symbols.add(symbol)
+            elif action == "delete":
+                symbols.discard(symbol)
+                continue
+            elif symbol not in symbols:
+                continue  # No key to update
+            if table == "quote":
+                self.__update_orderbook(symbol=symbol, values=val, quote=True)
+            elif table == "orderBook10":
+                self.__update_orderbook(symbol=symbol, values=val)
+            elif action == "update":
+                self.__update_instrument(symbol=symbol, values=val)
+
     def _generate_key(self, keys: list, val: dict) -> tuple:
         val["market"] = self.name
         return tuple((val[key]) for key in keys)
@@ -263,26 +301,26 @@ class Bitmex(Variables):
             self.pinging = "pong"
             return
 
-        message = json.loads(message)
+        message = decoder.loads(message)
         action = message["action"] if "action" in message else None
         table = message["table"] if "table" in message else None
         try:
-            if action:
+            if table in self.symbols:
+                self.__on_fast_table(table=table, action=action, message=message)
+            elif action:
                 # table_name = "orderBook" if table == "orderBook10" else table
                 table_name = table
                 if table_name not in self.data:
                     self.data[table_name] = OrderedDict()
                 if action == "partial":  # table snapshot
                     self.keys[table] = message["keys"]
-                    if table == "quote":
-                        self.keys[table] = ["symbol", "market"]
-                    elif table == "trade":
+                    if table == "trade":
                         self.keys[table] = ["trdMatchID"]
                     elif table == "execution":
                         self.keys[table] = ["execID"]
                     elif table == "margin":
                         self.keys[table] = ["currency", "market"]
-                    elif table in ["instrument", "orderBook10", "position"]:
+                    elif table == "position":
                         self.keys[table].append("market")
 
                     for val in message["data"]:
@@ -292,14 +330,8 @@ class Bitmex(Variables):
                                     break
                         else:
                             key = self._generate_key(self.keys[table], val)
-                            self.data[table_name][key] = val
-                            if table == "orderBook10":
-                                self.__update_orderbook(symbol=key, values=val)
-                            elif table == "quote":
-                                self.__update_orderbook(
-                                    symbol=key, values=val, quote=True
-                                )
-                            elif table == "margin":
+                            self._store(table_name, key=key, val=val)
+                            if table == "margin":
                                 self.__update_account(
                                     settlCurrency=key,
                                     values=val,
@@ -307,9 +339,7 @@ class Bitmex(Variables):
                 elif action == "insert":
                     for val in message["data"]:
                         key = self._generate_key(self.keys[table], val=val)
-                        if table == "quote":
-                            self.__update_orderbook(symbol=key, values=val, quote=True)
-                        elif table == "execution":
+                        if table == "execution":
                             val["ticker"] = val["symbol"]
                             val["symbol"] = (
                                 self.ticker[val["symbol"]],
@@ -359,17 +389,13 @@ class Bitmex(Variables):
                                 )
                                 self.logger.warning(message)
                         else:
-                            self.data[table_name][key] = val
+                            self._store(table_name, key=key, val=val)
                 elif action == "update":
                     for val in message["data"]:
                         key = self._generate_key(self.keys[table], val=val)
                         if key not in self.data[table_name]:
-                            return  # No key to update
-                        if table == "orderBook10":
-                            self.__update_orderbook(symbol=key, values=val)
-                        elif table == "instrument":
-                            self.__update_instrument(symbol=key, values=val)
-                        elif table == "position":
+                            continue  # No key to update
+                        if table == "position":
                             self.__update_position(key, values=val)
                         elif table == "margin":
                             self.__update_account(settlCurrency=key, values=val)
@@ -381,7 +407,7 @@ class Bitmex(Variables):
                 elif action == "delete":
                     for val in message["data"]:
                         key = self._generate_key(self.keys[table], val)
-                        self.data[table_name].pop(key)
+                        self.data[table_name].pop(key, None)
             elif "unsubscribe" in message:
                 symb = message["unsubscribe"].split(":")[1]
                 if symb in self.unsubscribe:
@@ -412,6 +438,7 @@ class Bitmex(Variables):
         """
         self.data = {}
         self.keys = {}
+        self.symbols = {"instrument": set(), self.depth: set()}
 
     def __update_orderbook(self, symbol: tuple, values: dict, quote=False) -> None:
         """
@@ -422,30 +449,22 @@ class Bitmex(Variables):
         instrument = self.Instrument[symbol]
         if quote:
             if "askPrice" in values:
-                instrument.asks = [
-                    [
-                        values["askPrice"],
-                        values["askSize"] / instrument.myMultiplier,
-                    ]
-                ]
+                instrument.asks.set_top(
+                    price=values["askPrice"],
+                    size=values["askSize"] / instrument.myMultiplier,
+                )
             if "bidPrice" in values:
-                instrument.bids = [
-                    [
-                        values["bidPrice"],
-                        values["bidSize"] / instrument.myMultiplier,
-                    ]
-                ]
+                instrument.bids.set_top(
+                    price=values["bidPrice"],
+                    size=values["bidSize"] / instrument.myMultiplier,
+                )
         else:
             if "asks" in values:
-                for ask in values["asks"]:
-                    ask[1] /= instrument.myMultiplier
-                instrument.asks = values["asks"]
+                instrument.asks.update(values["asks"], divisor=instrument.myMultiplier)
             if "bids" in values:
-                for bid in values["bids"]:
-                    bid[1] /= instrument.myMultiplier
-                instrument.bids = values["bids"]
+                instrument.bids.update(values["bids"], divisor=instrument.myMultiplier)
         if symbol in self.klines:
-            service.kline_hi_lo_values(self, symbol=symbol, instrument=instrument)
+            service.publish_top_of_book(self, symbol=symbol, instrument=instrument)
 
     def __update_position(self, key, values: dict) -> None:
         """
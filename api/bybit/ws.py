@@ -5,10 +5,12 @@ from collections import OrderedDict
 from datetime import datetime, timezone
 
 import services as service
+from api import decoder
 from api.bybit.erruni import Unify
 from api.init import Setup
 from api.variables import Variables
 from common.data import MetaAccount, MetaInstrument, MetaResult
+from common.orderbook import OrderBook
 from common.variables import Variables as var
 from display.messages import ErrorMessage, Message
 
@@ -66,6 +68,9 @@ class Bybit(Variables):
         self.settleCoin_list = list()
         self.logger = var.logger
         self.klines = dict()
+        self.books = dict()
+        self.resyncs = dict()
+        self.resync_attempts = 3
         self.setup_orders = list()
         self.account_disp = ""
         WebSocket._on_message = Bybit._on_message
@@ -193,17 +198,39 @@ class Bybit(Variables):
                 path="Private execution_stream",
             )
 
-    def __update_orderbook(self, values: dict, category: str) -> None:
+    def __update_orderbook(self, message: dict, category: str) -> None:
+        """
+        Applies the snapshot or delta message to the order book of the
+        symbol. "u" = 1 in a delta means that Bybit restarted the service
+        and the message is a snapshot. If a delta is missed, the topic is
+        subscribed again to receive a new snapshot.
+        """
+        values = message["data"]
         symbol = (self.ticker[(values["s"], category)], self.name)
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook()
+        if message["type"] == "snapshot" or values["u"] == 1:
+            book.snapshot(asks=values["a"], bids=values["b"], update_id=values["u"])
+            self.resyncs.pop(message["topic"], None)
+        elif not book.valid:
+            resync = self.resyncs.get(message["topic"])
+            if resync and time.time() - resync["time"] > var.timeout:
+                self._resync_orderbook(topic=message["topic"], category=category)
+            return
+        elif not book.delta(asks=values["a"], bids=values["b"], update_id=values["u"]):
+            self._put_message(
+                message=Message.ORDERBOOK_RESYNC.format(
+                    TOPIC=message["topic"], UPDATE=values["u"], LAST=book.update_id
+                ),
+                warning="warning",
+            )
+            self._resync_orderbook(topic=message["topic"], category=category)
+            return
         instrument = self.Instrument[symbol]
-        asks = list(map(lambda x: [float(x[0]), float(x[1])], values["a"]))
-        bids = list(map(lambda x: [float(x[0]), float(x[1])], values["b"]))
-        asks.sort(key=lambda x: x[0])
-        bids.sort(key=lambda x: x[0], reverse=True)
-        instrument.asks = asks[:10]
-        instrument.bids = bids[:10]
+        book.write(asks=instrument.asks, bids=instrument.bids, depth=10)
         if symbol in self.klines:
-            service.kline_hi_lo_values(self, symbol=symbol, instrument=instrument)
+            service.publish_top_of_book(self, symbol=symbol, instrument=instrument)
 
     def __update_ticker(self, values: dict, category: str) -> None:
         symb = self.ticker[(values["symbol"], category)]
@@ -303,17 +330,8 @@ class Bybit(Variables):
             if value["orderStatus"] == "Cancelled":
                 orderStatus = "Canceled"
             elif value["orderStatus"] == "New":
-                if value["orderLinkId"]:
-                    for orders in var.orders.values():
-                        for clOrdID in orders:
-                            if clOrdID == value["orderLinkId"]:
-                                orderStatus = "Replaced"
-                                break
-                        else:
-                            continue
-                        break
-                    else:
-                        orderStatus = "New"
+                if service.get_order(value["orderLinkId"])[1] is not None:
+                    orderStatus = "Replaced"
                 else:
                     orderStatus = "New"
             elif value["orderStatus"] == "Rejected":
@@ -422,7 +440,7 @@ class Bybit(Variables):
         Parse incoming messages. This method replaces the original Pybit API
         method to intercept websocket pings via the pinging variable.
         """
-        message = json.loads(message)
+        message = decoder.loads(message)
         if self._is_custom_pong(message):
             self.pinging = "pong"
             return
@@ -499,7 +517,7 @@ class Bybit(Variables):
                     depth=self.orderbook_depth[var.order_book_depth][category],
                     symbol=ticker,
                     callback=lambda x: self.__update_orderbook(
-                        values=x["data"], category="linear"
+                        message=x, category="linear"
                     ),
                 )
             except Exception as exception:
@@ -540,7 +558,7 @@ class Bybit(Variables):
                     depth=self.orderbook_depth[var.order_book_depth][category],
                     symbol=ticker,
                     callback=lambda x: self.__update_orderbook(
-                        values=x["data"], category="inverse"
+                        message=x, category="inverse"
                     ),
                 )
             except Exception as exception:
@@ -581,7 +599,7 @@ class Bybit(Variables):
                     depth=self.orderbook_depth[var.order_book_depth][category],
                     symbol=ticker,
                     callback=lambda x: self.__update_orderbook(
-                        values=x["data"], category="spot"
+                        message=x, category="spot"
                     ),
                 )
             except Exception as exception:
@@ -630,7 +648,7 @@ class Bybit(Variables):
                     depth=self.orderbook_depth[var.order_book_depth][category],
                     symbol=ticker,
                     callback=lambda x: self.__update_orderbook(
-                        values=x["data"], category="option"
+                        message=x, category="option"
                     ),
                 )
             except Exception as exception:
@@ -731,6 +749,50 @@ class Bybit(Variables):
 
         return unsubscription_args
 
+    def _resync_orderbook(self, topic: str, category: str) -> None:
+        """
+        Subscribes to the orderbook topic again, after which Bybit sends a
+        new snapshot. The requests carry req_id = "resync:<topic>", their
+        responses are checked by _process_resync_message(). The request is
+        repeated if the subscription fails or no snapshot arrives within
+        var.timeout. After resync_attempts attempts the market is
+        reconnected.
+        """
+        resync = self.resyncs.setdefault(topic, {"attempts": 0})
+        if resync["attempts"] >= self.resync_attempts:
+            del self.resyncs[topic]
+            self._put_message(
+                message=Message.ORDERBOOK_RESYNC_FAILED.format(
+                    TOPIC=topic, NUMBER=self.resync_attempts, MARKET=self.name
+                ),
+                warning="error",
+            )
+            service.unexpected_error(self)
+            return
+        resync["attempts"] += 1
+        resync["category"] = category
+        resync["time"] = time.time()
+        for op in ("unsubscribe", "subscribe"):
+            self.ws[category].ws.send(
+                json.dumps({"op": op, "req_id": "resync:" + topic, "args": [topic]})
+            )
+
+    @staticmethod
+    def _process_resync_message(message):
+        ws = var.market_object["Bybit"]
+        topic = message["req_id"][len("resync:") :]
+        if not message.get("success") and topic in ws.resyncs:
+            ws._put_message(
+                message=Message.ORDERBOOK_RESYNC_ERROR.format(
+                    TOPIC=topic, OP=message.get("op"), ERROR=message.get("ret_msg")
+                ),
+                warning="warning",
+            )
+            if message.get("op") != "unsubscribe":
+                ws._resync_orderbook(
+                    topic=topic, category=ws.resyncs[topic]["category"]
+                )
+
     def unsubscribe_symbol(self, symbol: tuple) -> str:
         unsubscription_args = self._subscribe_args_list(symbol=symbol)
         instrument = self.Instrument[symbol]
@@ -787,6 +849,8 @@ class Bybit(Variables):
     def _handle_incoming_message(self, message):
         if message.get("op") == "auth" or message.get("type") == "AUTH_RESP":
             self._process_auth_message(message)
+        elif str(message.get("req_id")).startswith("resync:"):
+            Bybit._process_resync_message(message)
         elif message.get("op") == "subscribe":
             self._process_subscription_message(message)
         elif message.get("type") == "COMMAND_RESP":
@@ -794,6 +858,10 @@ class Bybit(Variables):
                 self._process_subscription_message(message)
         elif message.get("op") == "unsubscribe":
             Bybit._process_unsubscription_message(message)
+        elif message.get("topic", "").startswith("orderbook"):
+            # The order book is kept by Bybit.__update_orderbook(), so the
+            # message is passed as is, without the Pybit copy of the book.
+            self._get_callback(message["topic"])(message)
         else:
             self._process_normal_message(message)
 
@@ -0,0 +1,22 @@
+"""
+JSON decoding of the websocket messages. orjson or msgspec is used when
+installed, otherwise the standard json module. All of them return the same
+dicts and lists, so the message handlers do not depend on the decoder.
+"""
+
+import json
+
+try:
+    import orjson
+
+    loads = orjson.loads
+    DECODER = "orjson"
+except ImportError:
+    try:
+        import msgspec
+
+        loads = msgspec.json.Decoder().decode
+        DECODER = "msgspec"
+    except ImportError:
+        loads = json.loads
+        DECODER = "json"
@@ -957,18 +957,10 @@ class Agent(Deribit):
                         )
                         his_data = history["data"]
                         if isinstance(his_data, list):
-                            for row in his_data:
-                                data = service.select_database(  # read_database
-                                    "select EXECID from %s where EXECID='%s' and account=%s and market='%s'"
-                                    % (
-                                        var.database_table,
-                                        row["execID"],
-                                        self.user_id,
-                                        self.name,
-                                    ),
-                                )
-                                if not data:
-                                    self.transaction(row=row)
+                            for row in service.new_executions(
+                                his_data, account=self.user_id, market=self.name
+                            ):
+                                self.transaction(row=row)
                         else:
                             message = "Failed request for funding and delivery information that arrived at 8:00 AM"
                             self.logger.error(message)
@@ -9,6 +9,7 @@ import requests
 import websocket
 
 import services as service
+from api import decoder
 from api.deribit.error import ErrorStatus
 from api.errors import Error
 from api.init import Setup
@@ -273,7 +274,7 @@ class Deribit(Variables):
 
     def __on_message(self, ws, message):
         try:
-            message = json.loads(message)
+            message = decoder.loads(message)
             if "result" in message:
                 id = message["id"]
                 if id == "get_token":
@@ -432,10 +433,10 @@ class Deribit(Variables):
     def __update_orderbook(self, values: dict) -> None:
         symbol = (self.ticker[values["instrument_name"]], self.name)
         instrument = self.Instrument[symbol]
-        instrument.asks = values["asks"]
-        instrument.bids = values["bids"]
+        instrument.asks.update(values["asks"])
+        instrument.bids.update(values["bids"])
         if symbol in self.klines:
-            service.kline_hi_lo_values(self, symbol=symbol, instrument=instrument)
+            service.publish_top_of_book(self, symbol=symbol, instrument=instrument)
 
     def __update_ticker(self, values: dict) -> None:
         symbol = (self.ticker[values["instrument_name"]], self.name)
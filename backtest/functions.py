@@ -1,4 +1,6 @@
 import os
+import struct
+from array import array
 from collections import OrderedDict
 from typing import Callable, Union
 
@@ -15,6 +17,87 @@ class Backtest:
     filename = ""
     filename_trade = ""
     trades = 0
+    results_file = None
+    trades_file = None
+    columnar = False
+    trade_columns = dict()
+
+
+class Writer:
+    """
+    Keeps a backtest output file open and writes the rows in chunks.
+    """
+
+    def __init__(self, filename: str, header: str, chunk: int = 10000) -> None:
+        self.file = open(filename, "w")
+        self.chunk = chunk
+        self.rows = [header]
+
+    def write(self, row: str) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            self.file.write("\n".join(self.rows) + "\n")
+            self.rows = []
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+COLUMNS_MAGIC = b"TMBTDATA"
+COLUMNS_HEADER = struct.Struct("<8sqqq")
+COLUMNS_ITEM = struct.Struct("<q")
+
+
+def save_columns(filename: str, columns: dict, mtime: int = 0, size: int = 0):
+    """
+    Saves typed arrays to a binary file.
+
+    File format: magic (8s), source mtime_ns (q), source size (q), number of
+    columns (q), then for each column: name length (q), name, typecode (1s),
+    number of bytes (q) and the array itself.
+    """
+    item = COLUMNS_ITEM
+    with open(filename, "wb") as f:
+        f.write(COLUMNS_HEADER.pack(COLUMNS_MAGIC, mtime, size, len(columns)))
+        for name, values in columns.items():
+            data = name.encode()
+            f.write(item.pack(len(data)) + data + values.typecode.encode())
+            data = values.tobytes()
+            f.write(item.pack(len(data)) + data)
+
+
+def read_columns(filename: str, mtime: int = None, size: int = None):
+    """
+    Reads typed arrays saved by save_columns(). If mtime or size are given
+    and do not match the values in the file, None is returned.
+    """
+    item = COLUMNS_ITEM
+    with open(filename, "rb") as f:
+        magic, file_mtime, file_size, number = COLUMNS_HEADER.unpack(
+            f.read(COLUMNS_HEADER.size)
+        )
+        if magic != COLUMNS_MAGIC:
+            return None
+        if mtime is not None and mtime != file_mtime:
+            return None
+        if size is not None and size != file_size:
+            return None
+        columns = dict()
+        for _ in range(number):
+            length = item.unpack(f.read(item.size))[0]
+            name = f.read(length).decode()
+            values = array(f.read(1).decode())
+            length = item.unpack(f.read(item.size))[0]
+            values.frombytes(f.read(length))
+            columns[name] = values
+
+    return columns
 
 
 def get_instrument(ws: Markets, symbol: tuple):
@@ -25,14 +108,10 @@ def get_instrument(ws: Markets, symbol: tuple):
     once, since the received information is saved in the database in the
     `backtest` table to speed up the program.
     """
-    qwr = (
-        "select * from backtest where SYMBOL ='"
-        + symbol[0]
-        + "' and MARKET = '"
-        + ws.name
-        + "';"
+    data = service.select_database(
+        "select * from backtest where SYMBOL = ? and MARKET = ?;",
+        params=(symbol[0], ws.name),
     )
-    data = service.select_database(qwr)
     if not data:
         symbols = ws.Instrument.get_keys()
         if symbols is None or symbol not in symbols:
@@ -45,34 +124,134 @@ def get_instrument(ws: Markets, symbol: tuple):
 
 
 def load_backtest_data(bot: BotData):
-    def fill(header, record, num, line):
+    print(" ")
+    for symbol in var.backtest_symbols:
+        filename = (
+            os.getcwd() + f"/backtest/data/{symbol[1]}/{symbol[0]}/{bot.timefr}.csv"
+        )
+        print("Loading backtest data from", filename)
+        columns = _load_columns(filename)
+        headers = list(columns.keys())
+        bot.backtest_data[symbol] = [
+            dict(zip(headers, values)) for values in zip(*columns.values())
+        ]
+    _check_data_size(bot=bot)
+
+
+class Columns:
+    """
+    Backtest data of one symbol stored column by column in typed arrays.
+    Indexing returns a row as a dictionary, the same as the list of
+    dictionaries made by load_backtest_data(), so strategies and the Tool
+    class work with both.
+    """
+
+    def __init__(self, columns: dict) -> None:
+        self.columns = columns
+        self.headers = list(columns.keys())
+        self.size = len(columns[self.headers[0]]) if columns else 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, num: Union[int, slice]) -> Union[dict, list]:
+        if isinstance(num, slice):
+            return [self[i] for i in range(*num.indices(self.size))]
+        if num < 0:
+            num += self.size
+        if num < 0 or num >= self.size:
+            raise IndexError("backtest data index out of range")
+
+        return {header: self.columns[header][num] for header in self.headers}
+
+    def __iter__(self):
+        for num in range(self.size):
+            yield self[num]
+
+
+def bar_value(data: Union[list, Columns], num: int, header: str) -> Union[int, float]:
+    """
+    Returns one value of the bar number ``num``. For Columns the value is
+    read from the column array without building the row dictionary.
+    """
+    if isinstance(data, Columns):
+        return data.columns[header][num]
+
+    return data[num][header]
+
+
+def _parse_columns(filename: str) -> dict:
+    """
+    Reads the csv file with backtest data into typed arrays: "date" and
+    "time" as integers, the rest as floats. Values that can not be
+    converted to float become 0.
+    """
+
+    def to_float(value: str) -> float:
+        try:
+            return float(value)
+        except Exception:
+            return 0
+
+    with open(filename, "r") as file:
+        headers = next(file).strip("\n").split(";")
+        lines = [line.strip("\n").split(";") for line in file]
+    columns = dict()
+    for num, header in enumerate(headers):
+        values = [line[num] for line in lines]
         if header in ["date", "time"]:
-            record[header] = int(line[num])
+            columns[header] = array("q", map(int, values))
         else:
             try:
-                record[header] = float(line[num])
-            except Exception:
-                record[header] = 0
+                columns[header] = array("d", map(float, values))
+            except ValueError:
+                columns[header] = array("d", map(to_float, values))
+
+    return columns
+
+
+def _load_columns(filename: str) -> dict:
+    """
+    Returns the backtest data of the csv file as typed arrays. After the
+    first parsing the arrays are saved to a binary cache file next to the
+    csv file, which is used as long as the size and modification time of
+    the csv file do not change.
+    """
+    cache = filename + ".cache"
+    stat = os.stat(filename)
+    try:
+        columns = read_columns(cache, mtime=stat.st_mtime_ns, size=stat.st_size)
+        if columns is not None:
+            return columns
+    except (OSError, struct.error, ValueError, UnicodeDecodeError):
+        pass
+    columns = _parse_columns(filename)
+    try:
+        save_columns(cache, columns, mtime=stat.st_mtime_ns, size=stat.st_size)
+    except OSError as exception:
+        print("Backtest data cache is not saved:", exception)
+
+    return columns
 
+
+def load_backtest_columns(bot: BotData):
+    """
+    Loads backtest data for the fast backtest mode, see run_fast().
+    """
     print(" ")
     for symbol in var.backtest_symbols:
-        bot.backtest_data[symbol] = list()
-        b_data: list = bot.backtest_data[symbol]
         filename = (
             os.getcwd() + f"/backtest/data/{symbol[1]}/{symbol[0]}/{bot.timefr}.csv"
         )
         print("Loading backtest data from", filename)
-        with open(filename, "r") as file:
-            headers = next(file).strip("\n").split(";")
-            for line in file:
-                line = line.strip("\n").split(";")
-                record = dict()
-                for num, header in enumerate(headers):
-                    fill(header, record, num, line)
-                b_data.append(record)
+        bot.backtest_data[symbol] = Columns(_load_columns(filename))
+    _check_data_size(bot=bot)
 
-    # Checking if the sizes of all backtesting data records are the same.
 
+def _check_data_size(bot: BotData):
+    """
+    Checking if the sizes of all backtesting data records are the same.
+    """
     if len(var.backtest_symbols) > 1:
         reference_size = len(bot.backtest_data[var.backtest_symbols[0]])
         reference_symbol = var.backtest_symbols[0]
@@ -90,8 +269,13 @@ def load_backtest_data(bot: BotData):
 
 def _save_trades(side: str, qty: float, price: float, time):
     data = str(time) + ";" + side + ";" + str(price) + ";" + str(qty)
-    with open(Backtest.filename_trade, "a") as f:
-        f.write(data + "\n")
+    Backtest.trades_file.write(data)
+    if Backtest.columnar:
+        columns = Backtest.trade_columns
+        columns["time"].append(int(time))
+        columns["side"].append(1 if side == "Buy" else -1)
+        columns["price"].append(price)
+        columns["qty"].append(qty)
 
 
 def _trade(
@@ -124,7 +308,7 @@ def _trade(
         ttime=ttime,
     )
     if clOrdID:
-        del var.orders[bot.name][clOrdID]
+        service.remove_order(emi=bot.name, clOrdID=clOrdID)
     else:
         clOrdID = service.set_clOrdID(emi=bot.name)
     Backtest.trades += 1
@@ -203,8 +387,7 @@ def _save_results_by_day(bot: BotData):
                 + ";"
                 + str(bot.bot_positions[symbol]["position"])
             )
-        with open(Backtest.filename, "a") as f:
-            f.write(data + "\n")
+        Backtest.results_file.write(data)
 
 
 def run(bot: BotData, strategy: Callable):
@@ -214,20 +397,112 @@ def run(bot: BotData, strategy: Callable):
         _check_trades(bot=bot)
         _save_results_by_day(bot=bot)
         strategy()
+    close_results_file()
+
+
+def _check_trades_fast(bot: BotData, columns: dict):
+    """
+    Same as _check_trades(), but reads the bar prices directly from the
+    column arrays and copies nothing unless an order is executed.
+    """
+    filled = list()
+    for clOrdID, order in var.orders[bot.name].items():
+        if order["side"] == "Sell":
+            if columns[order["symbol"]]["hi"][bot.iter] > order["price"]:
+                filled.append((clOrdID, order))
+        elif columns[order["symbol"]]["lo"][bot.iter] < order["price"]:
+            filled.append((clOrdID, order))
+    for clOrdID, order in filled:
+        data = columns[order["symbol"]]
+        ws = Markets[order["market"]]
+        _trade(
+            instrument=ws.Instrument[order["symbol"]],
+            bot=bot,
+            side=order["side"],
+            qty=order["leavesQty"],
+            price=order["price"],
+            ttime=str(data["date"][bot.iter]) + str(data["time"][bot.iter]),
+            clOrdID=clOrdID,
+        )
+
+
+def _results_row(bot: BotData, data: dict, num: int) -> str:
+    values = results(bot=bot, price=data["open_bid"][num + 1])
+    row = str(data["date"][num])
+    for symbol, value in values.items():
+        row += (
+            ";"
+            + symbol[0]
+            + ";"
+            + str(value["result"])
+            + ";"
+            + str(value["max_position"])
+            + ";"
+            + str(bot.bot_positions[symbol]["position"])
+        )
+
+    return row
+
+
+def run_fast(bot: BotData, strategy: Callable):
+    """
+    Fast backtest mode. The data must be loaded with
+    load_backtest_columns(). Bar prices are taken directly from the column
+    arrays, open orders are not copied on every bar, and the daily results
+    and trades are buffered by Writer and written to the files in chunks.
+    """
+    symbols = list(bot.backtest_data.keys())
+    size = len(bot.backtest_data[symbols[0]]) - 1
+    columns = {symbol: bot.backtest_data[symbol].columns for symbol in symbols}
+    for bot.iter in range(1, size):
+        if var.orders[bot.name]:
+            _check_trades_fast(bot=bot, columns=columns)
+        if bot.bot_positions:
+            data = columns[next(iter(bot.bot_positions))]
+            if data["date"][bot.iter] != data["date"][bot.iter + 1]:
+                Backtest.results_file.write(
+                    _results_row(bot=bot, data=data, num=bot.iter)
+                )
+        strategy()
+    close_results_file()
 
 
-def create_results_file(bot: BotData):
-    Backtest.filename = os.getcwd() + "/backtest/results.txt"
-    f = open(Backtest.filename, "w")
+def create_results_file(bot: BotData, suffix: str = "", columnar: bool = False):
+    """
+    Opens the results and trades files of the backtest. The rows are
+    buffered and written in chunks, the files are closed by
+    close_results_file() at the end of the run.
+
+    If columnar is True, the trades are also saved as typed arrays to
+    backtest/trades<suffix>.bin, see read_columns().
+    """
+    close_results_file()
+    Backtest.filename = os.getcwd() + "/backtest/results" + suffix + ".txt"
     row = "date"
     for _ in bot.bot_positions.keys():
         row += ";symbol;result;max"
-    row += "\n"
-    f.write(row)
-    f.close
-
-    Backtest.filename_trade = os.getcwd() + "/backtest/trades.txt"
-    f = open(Backtest.filename_trade, "w")
-    row = "time;side;price;qty\n"
-    f.write(row)
-    f.close
+    Backtest.results_file = Writer(Backtest.filename, header=row)
+
+    Backtest.filename_trade = os.getcwd() + "/backtest/trades" + suffix + ".txt"
+    Backtest.trades_file = Writer(Backtest.filename_trade, header="time;side;price;qty")
+    Backtest.columnar = columnar
+    Backtest.trade_columns = {
+        "time": array("q"),
+        "side": array("b"),
+        "price": array("d"),
+        "qty": array("d"),
+    }
+
+
+def close_results_file():
+    """
+    Writes the buffered rows and closes the results and trades files.
+    """
+    if Backtest.results_file:
+        Backtest.results_file.close()
+        Backtest.results_file = None
+    if Backtest.trades_file:
+        Backtest.trades_file.close()
+        Backtest.trades_file = None
+        if Backtest.columnar:
+            save_columns(Backtest.filename_trade[:-4] + ".bin", Backtest.trade_columns)
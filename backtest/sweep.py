@@ -0,0 +1,178 @@
+import itertools
+import multiprocessing
+import os
+import random
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Union
+
+import services as service
+from backtest import functions as backtest
+from common.data import BotData
+from common.variables import Variables as var
+
+
+class Sweep:
+    """
+    State of the current parameter sweep. Worker processes are forked after
+    these values are set, so every worker gets the loaded backtest data and
+    instruments without copying them through a pipe.
+    """
+
+    bot: BotData = None
+    prepare: Callable = None
+    fast = True
+
+
+def grid(parameters: dict) -> list:
+    """
+    Returns all combinations of the parameter values.
+
+    Example
+    -------
+    grid({"period": [10, 20], "ratio": [0.5, 1]}) returns
+    [{"period": 10, "ratio": 0.5}, {"period": 10, "ratio": 1},
+    {"period": 20, "ratio": 0.5}, {"period": 20, "ratio": 1}]
+    """
+    names = list(parameters.keys())
+
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(parameters[name] for name in names))
+    ]
+
+
+def random_grid(parameters: dict, number: int, seed=None) -> list:
+    """
+    Returns ``number`` random combinations of the parameter values without
+    repetition.
+    """
+    combinations = grid(parameters)
+    if number >= len(combinations):
+        return combinations
+
+    return random.Random(seed).sample(combinations, number)
+
+
+def _reset(bot: BotData) -> None:
+    bot.bot_positions = dict()
+    bot.iter = 0
+    var.orders[bot.name] = OrderedDict()
+    service.clear_order_index()
+    backtest.Backtest.trades = 0
+
+
+def _run_one(number: int, parameters: dict) -> dict:
+    """
+    Runs one backtest with the given parameters.
+    """
+    bot = Sweep.bot
+    _reset(bot)
+    strategy = Sweep.prepare(parameters)
+    backtest.create_results_file(bot, suffix="_sweep_" + str(number))
+    if Sweep.fast:
+        backtest.run_fast(bot=bot, strategy=strategy)
+    else:
+        backtest.run(bot=bot, strategy=strategy)
+    values = backtest.results(bot=bot)
+
+    return {
+        "number": number,
+        "parameters": parameters,
+        "result": sum(value["result"] for value in values.values()),
+        "trades": backtest.Backtest.trades,
+        "values": values,
+    }
+
+
+def run_sweep(
+    bot: BotData,
+    prepare: Callable,
+    parameter_sets: list,
+    workers: Union[int, None] = None,
+    fast: bool = True,
+) -> list:
+    """
+    Runs a backtest for every parameter set and returns the results ranked
+    by the total result, the best first.
+
+    Parameters
+    ----------
+    bot: BotData
+        The bot with loaded backtest data, see load_backtest_data() and
+        load_backtest_columns().
+    prepare: Callable
+        Takes a dictionary of parameters, sets up the strategy and returns
+        the callable that is called on every bar.
+    parameter_sets: list
+        List of dictionaries, see grid() and random_grid().
+    workers: int
+        Number of worker processes. Defaults to the number of CPUs.
+    fast: bool
+        If True, run_fast() is used, otherwise run().
+
+    Returns
+    -------
+    list
+        Dictionaries with the keys "number", "parameters", "result",
+        "trades", "values". The results of each run are also saved in the
+        backtest/results_sweep_<number>.txt and
+        backtest/trades_sweep_<number>.txt files.
+
+    Notes
+    -----
+    Worker processes are started with fork, so that each of them gets its
+    own copy of Bots, var.orders and Backtest, while the loaded backtest
+    data is shared until it is changed. Where fork is not available
+    (Windows), the runs are made one after another in this process.
+    """
+    backtest.close_results_file()
+    Sweep.bot = bot
+    Sweep.prepare = prepare
+    Sweep.fast = fast
+    rows = list()
+    if "fork" in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context("fork"),
+        ) as executor:
+            futures = [
+                executor.submit(_run_one, number, parameters)
+                for number, parameters in enumerate(parameter_sets)
+            ]
+            for future in futures:
+                rows.append(future.result())
+    else:
+        for number, parameters in enumerate(parameter_sets):
+            rows.append(_run_one(number, parameters))
+        _reset(bot)
+    rows.sort(key=lambda row: row["result"], reverse=True)
+
+    return rows
+
+
+def save_sweep_results(rows: list, filename: str = "") -> str:
+    """
+    Saves the ranked results of run_sweep() to a ``;`` separated file,
+    backtest/sweep.txt by default, and returns the file name.
+    """
+    if not filename:
+        filename = os.getcwd() + "/backtest/sweep.txt"
+    names = list()
+    for row in rows:
+        for name in row["parameters"]:
+            if name not in names:
+                names.append(name)
+    lines = [";".join(["rank", "number"] + names + ["result", "trades"])]
+    for rank, row in enumerate(rows, 1):
+        lines.append(
+            ";".join(
+                [str(rank), str(row["number"])]
+                + [str(row["parameters"].get(name, "")) for name in names]
+                + [str(row["result"]), str(row["trades"])]
+            )
+        )
+    with open(filename, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return filename
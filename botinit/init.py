@@ -44,22 +44,13 @@ def add_subscription(subscriptions: set) -> None:
     for symbol, res in var.subscription_res.items():
         ws = Markets[symbol[1]]
         if res:
-            qwr = (
-                "select MARKET, SYMBOL, sum(abs(QTY)) as SUM_QTY, "
-                + "sum(SUMREAL) as SUM_SUMREAL from "
-                + var.database_table
-                + " where SYMBOL = '"
-                + symbol[0]
-                + "' and SIDE <> 'Fund' and market = '"
-                + symbol[1]
-                + "' and ACCOUNT = "
-                + str(ws.user_id)
-                + ";"
+            data = service.ledger_totals(
+                account=ws.user_id, market=symbol[1], symbol=symbol[0]
             )
-            data = service.select_database(qwr)
             instrument = ws.Instrument[symbol]
-            instrument.volume = round(data[0]["SUM_QTY"], instrument.precision)
-            instrument.sumreal = data[0]["SUM_SUMREAL"]
+            if data:
+                instrument.volume = round(data[()]["volume"], instrument.precision)
+                instrument.sumreal = data[()]["sumreal"]
 
 
 def load_bot_parameters():
@@ -90,35 +81,20 @@ def load_bots() -> None:
 
     # Loading volumes and trade results for instruments.
 
-    union = ""
-    sql = ""
-    symbols = dict()
+    var.lock.acquire(True)
     for market in var.market_list:
         ws = Markets[market]
-        symbols[market] = ws.Instrument.get_keys()
-        sql += union
-        sql += (
-            "select MARKET, SYMBOL, sum(abs(QTY)) as SUM_QTY, sum(SUMREAL) "
-            + "as SUM_SUMREAL from "
-            + var.database_table
-            + " where MARKET = '"
-            + market
-            + "' and account = '"
-            + str(ws.user_id)
-            + "' and side <> 'Fund' group by SYMBOL"
+        symbols = ws.Instrument.get_keys()
+        data = service.ledger_totals(
+            group=("symbol",), account=ws.user_id, market=market
         )
-        union = " union ALL "
-    sql += ";"
-    var.lock.acquire(True)
-    data = service.select_database(sql)
-    for value in data:
-        ws = Markets[value["MARKET"]]
-        symbol = (value["SYMBOL"], value["MARKET"])
-        if symbol in symbols[market]:
-            instrument = ws.Instrument[symbol]
-            precision = instrument.precision
-            instrument.volume = round(float(value["SUM_QTY"]), precision)
-            instrument.sumreal = float(value["SUM_SUMREAL"])
+        for (symb,), value in data.items():
+            symbol = (symb, market)
+            if symbols and symbol in symbols:
+                instrument = ws.Instrument[symbol]
+                precision = instrument.precision
+                instrument.volume = round(float(value["volume"]), precision)
+                instrument.sumreal = float(value["sumreal"])
     var.lock.release()
 
     # Search for unclosed positions. If an unclosed position belongs to a bot
@@ -130,8 +106,7 @@ def load_bots() -> None:
     update_symbol = dict()
     while update:
         update = False
-        qwr = functions.SelectDatabase.QWR.format(DATABASE_TABLE=var.database_table)
-        data = service.select_database(qwr)
+        data = service.unclosed_positions()
         subscriptions = set()
         update_symbol = dict()
         for value in data:
@@ -152,17 +127,10 @@ def load_bots() -> None:
                     if name not in Bots.keys():
                         if name != "":
                             qwr = (
-                                "select ID, EMI, SYMBOL from %s where side <> 'Fund' and EMI = '%s'"
-                                % (var.database_table, name)
+                                "update %s set EMI = '' where side <> 'Fund' "
+                                "and EMI = ?;" % var.database_table
                             )
-                            data = service.select_database(qwr)
-                            for row in data:
-                                qwr = "update %s set EMI = '%s' where ID = %s;" % (
-                                    var.database_table,
-                                    "",
-                                    row["ID"],
-                                )
-                                service.update_database(query=qwr)
+                            service.update_database(query=qwr, params=(name,))
                             update = True
 
     # Adding subscriptions to unclosed positions found in the database (if any).
@@ -216,28 +184,18 @@ def load_bots() -> None:
     for name in Bots.keys():
         # Open Positions
 
-        qwr = (
-            "select * from (select SYMBOL, CATEGORY, MARKET, TICKER, "
-            + "ifnull(sum(SUMREAL), 0) SUMREAL, ifnull(sum(case when SIDE = "
-            + "'Fund' then 0 else QTY end), 0) POS, ifnull(sum(case when SIDE "
-            + "= 'Fund' then 0 else abs(QTY) end), 0) VOL, ifnull(sum(COMMISS)"
-            + ", 0) COMMISS, ifnull(max(TTIME), '1900-01-01 01:01:01.000000') "
-            + "LTIME from "
-            + var.database_table
-            + " where EMI = '"
-            + name
-            + "' group by SYMBOL) T where POS <> 0;"
-        )
         var.lock.acquire(True)
-        data = service.select_database(qwr)
+        data = service.ledger_totals(group=("market", "symbol"), emi=name)
         bot = Bots[name]
-        for value in data:
-            symbol = (value["SYMBOL"], value["MARKET"])
-            if value["MARKET"] in var.market_list:
-                ws = Markets[value["MARKET"]]
+        for (market, symb), value in data.items():
+            symbol = (symb, market)
+            if value["position"] == 0:
+                continue
+            if market in var.market_list:
+                ws = Markets[market]
                 instrument = ws.Instrument[symbol]
                 precision = instrument.precision
-                bot_pos = round(float(value["POS"]), precision)
+                bot_pos = round(float(value["position"]), precision)
                 if bot_pos != 0:
                     service.fill_bot_position(
                         bot_name=name,
@@ -245,67 +203,55 @@ def load_bots() -> None:
                         instrument=instrument,
                         user_id=ws.user_id,
                         position=bot_pos,
-                        volume=round(float(value["VOL"]), precision),
-                        sumreal=float(value["SUMREAL"]),
-                        commiss=float(value["COMMISS"]),
-                        ltime=service.time_converter(time=value["LTIME"], usec=True),
+                        volume=round(float(value["volume"]), precision),
+                        sumreal=float(value["sumreal"]),
+                        commiss=float(value["commiss"] + value["funding"]),
+                        ltime=service.time_converter(
+                            time=value["ltime"] or "1900-01-01 01:01:01.000000",
+                            usec=True,
+                        ),
                     )
-            elif value["POS"] != 0:
+            else:
                 message = (
                     name
                     + " bot has open position on "
                     + str(symbol)
                     + ", but "
-                    + value["MARKET"]
+                    + market
                     + " is not enabled. Position on "
                     + str(symbol)
                     + " ignored. Add "
-                    + value["MARKET"]
+                    + market
                     + " to the .env.Settings file."
                 )
                 _put_message(market="", message=message, warning="warning")
 
         # Results by currency for closed positions
 
-        qwr = (
-            "select SYMBOL, MARKET, CURRENCY, ifnull(sum(SUMREAL), 0) "
-            + "SUMREAL, ifnull(sum(COMMISS), 0) COMMISS, ifnull(sum(case when SIDE = "
-            + "'Fund' then 0 else QTY end), 0) POS, ifnull(max(TTIME), "
-            + "'1900-01-01 01:01:01.000000') LTIME from "
-            + var.database_table
-            + " where EMI = '"
-            + name
-            + "' group by MARKET, SYMBOL"
-        )
-
-        data = service.select_database(qwr)
         bot.bot_pnl = {}
-        for value in data:
-            if value["MARKET"] in var.market_list:
-                symbol = (value["SYMBOL"], value["MARKET"])
-                ws = Markets[value["MARKET"]]
+        for (market, symb), value in data.items():
+            if market in var.market_list:
+                symbol = (symb, market)
+                ws = Markets[market]
                 instrument = ws.Instrument[symbol]
                 precision = instrument.precision
-                bot_pos = round(float(value["POS"]), precision)
+                bot_pos = round(float(value["position"]), precision)
                 if bot_pos == 0:
-                    if value["MARKET"] not in bot.bot_pnl:
-                        bot.bot_pnl[value["MARKET"]] = dict()
-                    if value["CURRENCY"] not in bot.bot_pnl[value["MARKET"]]:
-                        bot.bot_pnl[value["MARKET"]][value["CURRENCY"]] = dict()
-                        bot.bot_pnl[value["MARKET"]][value["CURRENCY"]]["pnl"] = 0
-                        bot.bot_pnl[value["MARKET"]][value["CURRENCY"]][
-                            "commission"
-                        ] = 0
-                    bot.bot_pnl[value["MARKET"]][value["CURRENCY"]]["pnl"] += value[
-                        "SUMREAL"
-                    ]
-                    bot.bot_pnl[value["MARKET"]][value["CURRENCY"]][
-                        "commission"
-                    ] += value["COMMISS"]
+                    currency = value["currency"]
+                    if market not in bot.bot_pnl:
+                        bot.bot_pnl[market] = dict()
+                    if currency not in bot.bot_pnl[market]:
+                        bot.bot_pnl[market][currency] = dict()
+                        bot.bot_pnl[market][currency]["pnl"] = 0
+                        bot.bot_pnl[market][currency]["commission"] = 0
+                    bot.bot_pnl[market][currency]["pnl"] += value["sumreal"]
+                    bot.bot_pnl[market][currency]["commission"] += (
+                        value["commiss"] + value["funding"]
+                    )
                     bot.iter = name
             else:
                 message = ErrorMessage.BOT_PNL_CALCULATIONS.format(
-                    BOT_NAME=name, MARKET=value["MARKET"]
+                    BOT_NAME=name, MARKET=market
                 )
                 _put_message(market="", message=message, warning="warning")
         var.lock.release()
@@ -0,0 +1,214 @@
+"""
+Main process side of the bots that run in a separate process, see
+botinit/worker.py. For such a bot robo.run_bot holds a function that sends
+a snapshot of the bot's instruments, klines, positions and orders to the
+worker, waits until the worker's run_bot() is finished and then places,
+moves and cancels the orders the strategy asked for.
+"""
+
+import os
+import pickle
+import subprocess
+import sys
+import threading
+from datetime import datetime
+from typing import Callable, Union
+
+import functions
+import services as service
+from api.setup import Markets
+from common.data import Bots, Instrument, MetaInstrument
+from common.variables import Variables as var
+
+
+class BotProcessError(Exception):
+    """
+    run_bot() failed in the worker process. The message contains the
+    traceback from the worker.
+    """
+
+
+class BotProcess:
+    """
+    The worker process of one bot.
+    """
+
+    def __init__(self, bot_name: str, module: str) -> None:
+        self.bot_name = bot_name
+        self.module = module
+        self.lock = threading.Lock()
+        self.symbols = list()
+        self.klines = list()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "botinit.worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.getcwd(),
+        )
+
+    def _send(self, message: tuple) -> None:
+        pickle.dump(message, self.process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+        self.process.stdin.flush()
+
+    def _call(self, message: tuple) -> tuple:
+        """
+        Sends the command and answers the worker's requests until the
+        command is completed.
+        """
+        self._send(message)
+        while True:
+            try:
+                answer = pickle.load(self.process.stdout)
+            except EOFError:
+                raise BotProcessError(
+                    "The worker process of the bot " + self.bot_name + " exited."
+                )
+            if answer[0] == "error":
+                raise BotProcessError(answer[1])
+            elif answer[0] == "instrument":
+                self._send(("reply", self._instrument_data(answer[1])))
+            elif answer[0] == "history":
+                store = functions.Function.kline_store(
+                    Markets[answer[1][1]], symbol=answer[1], timefr=answer[2]
+                )
+                self._send(("reply", store.filename))
+            elif answer[0] == "order_qty":
+                instrument = MetaInstrument.market[answer[1][1]][answer[1]]
+                price = service.ticksize_rounding(
+                    price=answer[2], ticksize=instrument.tickSize
+                )
+                qty = service.level_qty(symbol=answer[1], price=price, side=answer[3])
+                self._send(("reply", qty))
+            else:
+                return answer
+
+    def _instrument_data(self, symbol: tuple) -> Union[dict, None]:
+        """
+        Values of the instrument passed to the worker: the scalar fields,
+        the order book and the bot's position.
+        """
+        market = MetaInstrument.market.get(symbol[1], {})
+        if symbol not in market:
+            return
+        instrument: Instrument = market[symbol]
+        data = {
+            key: value
+            for key, value in instrument.__dict__.items()
+            if isinstance(value, (str, int, float, bool, datetime, type(None)))
+        }
+        data["bids"] = list(instrument.bids)
+        data["asks"] = list(instrument.asks)
+        bot = Bots[self.bot_name]
+        if symbol not in bot.bot_positions:
+            service.fill_bot_position(
+                bot_name=self.bot_name,
+                symbol=symbol,
+                instrument=instrument,
+                user_id=Markets[symbol[1]].user_id,
+            )
+        data["bot_position"] = dict(bot.bot_positions[symbol])
+
+        return data
+
+    def _snapshot(self) -> dict:
+        bot = Bots[self.bot_name]
+        snapshot = {
+            "state": bot.state,
+            "orders": list(var.orders[self.bot_name].values()),
+            "tools": dict(),
+            "klines": dict(),
+        }
+        for symbol in self.symbols:
+            snapshot["tools"][symbol] = self._instrument_data(symbol)
+        for symbol, timefr in self.klines:
+            ws = Markets[symbol[1]]
+            service.fold_kline_hi_lo(ws, symbol=symbol)
+            try:
+                rows = list(ws.klines[symbol][timefr]["data"])
+            except KeyError:
+                rows = list()
+            snapshot["klines"][(symbol, timefr)] = rows
+
+        return snapshot
+
+    def load(self) -> None:
+        bot = Bots[self.bot_name]
+        with self.lock:
+            _, self.symbols, self.klines = self._call(
+                (
+                    "load",
+                    self.module,
+                    {"name": bot.name, "timefr": bot.timefr, "state": bot.state},
+                )
+            )
+
+    def run(self) -> list:
+        with self.lock:
+            _, intents, self.symbols, self.klines = self._call(
+                ("run", self._snapshot())
+            )
+
+        return intents
+
+    def stop(self) -> None:
+        with self.lock:
+            try:
+                self._send(("stop",))
+                self.process.wait(timeout=var.timeout)
+            except Exception:
+                self.process.kill()
+
+
+class Processes:
+    """
+    Worker processes by bot name.
+    """
+
+    workers = dict()
+    lock = threading.Lock()
+
+
+def execute(bot_name: str, intents: list) -> None:
+    """
+    Carries out the order intents returned by the worker with the same
+    functions that run_bot() calls in the main process.
+    """
+    import tools  # tools imports display.bot_menu, which imports this module
+
+    bot = Bots[bot_name]
+    for symbol, method, kwargs in intents:
+        if symbol is None:
+            getattr(tools.Bot, method)(bot, **kwargs)
+        else:
+            tool = getattr(tools, symbol[1])[symbol[0]]
+            getattr(tool, method)(bot=bot, **kwargs)
+
+
+def start_process(bot_name: str, module: str) -> Callable:
+    """
+    Starts the worker process of the bot, loads strategy.py in it and
+    returns the function to be stored in robo.run_bot.
+    """
+    stop_process(bot_name)
+    worker = BotProcess(bot_name=bot_name, module=module)
+    with Processes.lock:
+        Processes.workers[bot_name] = worker
+    try:
+        worker.load()
+    except BotProcessError:
+        stop_process(bot_name)
+        raise
+
+    return lambda: execute(bot_name=bot_name, intents=worker.run())
+
+
+def stop_process(bot_name: str) -> None:
+    with Processes.lock:
+        worker = Processes.workers.pop(bot_name, None)
+    if worker:
+        worker.stop()
+
+
+def stop_all() -> None:
+    for bot_name in list(Processes.workers):
+        stop_process(bot_name)
@@ -0,0 +1,265 @@
+"""
+Runs run_bot() of a bot whose strategy.py sets RUN_IN_PROCESS = True in a
+separate process, so that CPU-heavy strategies do not hold the GIL of the
+process that handles the websockets and the screen.
+
+The process is started by botinit/process.py as ``python -m
+botinit.worker``. The main process sends pickled commands to stdin and the
+worker answers to stdout. Before importing strategy.py, the worker puts its
+own ``tools`` module into sys.modules. Its Bot and Tool classes read the
+order books, klines, positions and orders from the snapshot received with
+every "run" command, and buy(), sell(), remove(), replace() and set_limit()
+only record order intents. The intents are returned when run_bot() is
+finished and are carried out by the main process, which owns the orders.
+The klines saved on disk, see kline_history(), are read directly from the
+memory-mapped files of the main process, opened read-only.
+"""
+
+import importlib
+import os
+import pickle
+import sys
+import traceback
+import types
+from collections import OrderedDict
+from typing import Callable, Union
+
+from common.klines import KlineStore
+
+
+class Worker:
+    """
+    State of the worker process.
+    """
+
+    reader = None
+    writer = None
+    bot = None
+    tools = dict()
+    klines = dict()
+    histories = dict()
+    snapshot = dict()
+    intents = list()
+
+
+def send(message: tuple) -> None:
+    pickle.dump(message, Worker.writer, protocol=pickle.HIGHEST_PROTOCOL)
+    Worker.writer.flush()
+
+
+def receive() -> tuple:
+    return pickle.load(Worker.reader)
+
+
+def request(*message) -> Union[dict, str, float, None]:
+    """
+    Asks the main process for data that is not in the snapshot.
+    """
+    send(message)
+    _, value = receive()
+
+    return value
+
+
+class Bot:
+    def __init__(self) -> None:
+        self.__dict__ = Worker.bot.__dict__
+
+    def remove(self, clOrdID: str = "") -> None:
+        Worker.intents.append((None, "remove", {"clOrdID": clOrdID}))
+
+    def replace(self, clOrdID: str, price: float) -> None:
+        Worker.intents.append((None, "replace", {"clOrdID": clOrdID, "price": price}))
+
+    def orders(
+        self, side: str = "", descend=False, in_list=True
+    ) -> Union[OrderedDict, list]:
+        return _filter(Worker.snapshot["orders"], side, descend, in_list)
+
+
+class _BotData:
+    def __init__(self, data: dict) -> None:
+        self.__dict__.update(data)
+
+
+class Tool:
+    def __init__(self, symbol: tuple, data: dict) -> None:
+        self.__dict__.update(data)
+        self.symbol_tuple = symbol
+
+    def close_all(self, bot: Bot, qty: float) -> None:
+        pass
+
+    def _intent(self, method: str, **kwargs) -> None:
+        Worker.intents.append((self.symbol_tuple, method, kwargs))
+
+    def sell(
+        self,
+        bot: Bot,
+        qty: float = None,
+        price: float = None,
+        move: bool = False,
+        cancel: bool = False,
+        ordType: str = "Limit",
+    ) -> None:
+        self._intent(
+            "sell", qty=qty, price=price, move=move, cancel=cancel, ordType=ordType
+        )
+
+    def buy(
+        self,
+        bot: Bot,
+        qty: float = None,
+        price: float = None,
+        move: bool = False,
+        cancel: bool = False,
+        ordType: str = "Limit",
+    ) -> None:
+        self._intent(
+            "buy", qty=qty, price=price, move=move, cancel=cancel, ordType=ordType
+        )
+
+    def add_kline(self, timefr: str = "") -> Callable:
+        key = (self.symbol_tuple, timefr or Worker.bot.timefr)
+        Worker.klines[key] = list()
+
+        return lambda *args: self._kline(key, *args)
+
+    def _kline(self, key: tuple, *args) -> dict:
+        if not args:
+            values = {"data": Worker.klines[key]}
+        else:
+            values = Worker.klines[key][args[0]]
+        values["bid"] = self.bids[0][0] if self.bids else 0
+        values["ask"] = self.asks[0][0] if self.asks else 0
+
+        return values
+
+    def kline_history(self, timefr: str = "") -> KlineStore:
+        key = (self.symbol_tuple, timefr or Worker.bot.timefr)
+        if key not in Worker.histories:
+            filename = request("history", key[0], key[1])
+            Worker.histories[key] = KlineStore(filename, readonly=True)
+
+        return Worker.histories[key]
+
+    def set_limit(self, bot: Bot, limit: float) -> None:
+        if limit < self.minOrderQty:
+            limit = self.minOrderQty
+        self.bot_position["limits"] = limit
+        self._intent("set_limit", limit=limit)
+
+    def limit(self, bot: Bot) -> float:
+        return self.bot_position["limits"]
+
+    def position(self, bot: Bot) -> float:
+        return self.bot_position["position"]
+
+    def orders(
+        self, bot: Bot, side: str = None, descend: bool = False, in_list=True
+    ) -> Union[OrderedDict, list]:
+        orders = [
+            order
+            for order in Worker.snapshot["orders"]
+            if order["symbol"] == self.symbol_tuple
+        ]
+
+        return _filter(orders, side, descend, in_list)
+
+    def order_qty(self, price: float, side: str = "") -> float:
+        return request("order_qty", self.symbol_tuple, price, side)
+
+
+def _filter(
+    orders: list, side: str, descend: bool, in_list: bool
+) -> Union[OrderedDict, list]:
+    filtered = [order for order in orders if not side or order["side"] == side]
+    if descend:
+        filtered.sort(key=lambda x: x["transactTime"], reverse=True)
+    if not in_list:
+        filtered = OrderedDict((order["clOrdID"], order) for order in filtered)
+
+    return filtered
+
+
+class MetaTool(type):
+    def __getitem__(self, item) -> Tool:
+        symbol = (item, self.__qualname__)
+        if symbol not in Worker.tools:
+            data = request("instrument", symbol)
+            if data is None:
+                raise ValueError(f"The instrument {symbol} not found.")
+            Worker.tools[symbol] = Tool(symbol, data)
+
+        return Worker.tools[symbol]
+
+
+class Bitmex(metaclass=MetaTool):
+    pass
+
+
+class Bybit(metaclass=MetaTool):
+    pass
+
+
+class Deribit(metaclass=MetaTool):
+    pass
+
+
+def _tools_module() -> types.ModuleType:
+    module = types.ModuleType("tools")
+    for cls in (Bot, Tool, MetaTool, Bitmex, Bybit, Deribit):
+        setattr(module, cls.__name__, cls)
+
+    return module
+
+
+def load(module: str, bot: dict) -> object:
+    Worker.bot = _BotData(bot)
+    sys.modules["tools"] = _tools_module()
+
+    return importlib.import_module(module)
+
+
+def run(strategy: object, snapshot: dict) -> list:
+    Worker.snapshot = snapshot
+    Worker.bot.state = snapshot["state"]
+    Worker.intents = list()
+    for symbol, data in snapshot["tools"].items():
+        Worker.tools[symbol].__dict__.update(data)
+    for key, rows in snapshot["klines"].items():
+        Worker.klines[key] = rows
+    for store in Worker.histories.values():
+        store.refresh()
+    strategy.run_bot()
+
+    return Worker.intents
+
+
+def main() -> None:
+    # Anything the strategy prints goes to stderr, stdout carries messages.
+    Worker.writer = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    Worker.reader = sys.stdin.buffer
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    strategy = None
+    while True:
+        try:
+            message = receive()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+        try:
+            if message[0] == "load":
+                strategy = load(module=message[1], bot=message[2])
+                send(("ready", list(Worker.tools), list(Worker.klines)))
+            elif message[0] == "run":
+                intents = run(strategy=strategy, snapshot=message[1])
+                send(("done", intents, list(Worker.tools), list(Worker.klines)))
+        except Exception:
+            send(("error", traceback.format_exc()))
+
+
+if __name__ == "__main__":
+    main()
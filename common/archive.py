@@ -0,0 +1,258 @@
+"""
+Old trades of closed positions are moved from the trade table into the
+monthly archive tables <table>_YYYY_MM. Archiving is off by default. When
+var.archive_days is set, it runs at startup and then every
+var.archive_interval seconds, see archive_update(). The rows it moves do
+not return to the trade table if archiving is turned off again. For every EMI and symbol whose
+trades were moved, the trade table keeps one opening balance row with
+EXECID = 'Bal' and SIDE = 'Bal': QTY is 0, QTY_REST holds the archived
+volume, SUMREAL and COMMISS hold the archived totals. Old funding rows are
+rolled up in the same way into one row with EXECID = 'Bal' and SIDE =
+'Fund'. Sums over the trade table therefore stay exact, while the full
+history remains available through the <table>_all view.
+"""
+
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+from common.variables import Variables as var
+
+BALANCE = "Bal"
+COLUMNS = (
+    "EXECID, EMI, REFER, MARKET, CURRENCY, SYMBOL, TICKER, CATEGORY, SIDE, "
+    + "QTY, QTY_REST, PRICE, THEOR_PRICE, TRADE_PRICE, SUMREAL, COMMISS, "
+    + "TTIME, DAT, CLORDID, ACCOUNT"
+)
+# Rows whose TTIME is not a date have no month and are never moved.
+MONTH = "strftime('%Y_%m', TTIME)"
+
+
+class Schedule:
+    """
+    The event is set to stop archive_update() when Tmatic is closed.
+    """
+
+    event = threading.Event()
+
+
+def archive_tables(table: str) -> list:
+    """
+    Returns the names of the archive tables of the trade table, the oldest
+    first.
+    """
+    rows = var.cursor_sqlite.execute(
+        "select name from sqlite_master where type = 'table' order by name"
+    ).fetchall()
+    pattern = re.compile(re.escape(table) + r"_\d{4}_\d{2}")
+
+    return [row[0] for row in rows if pattern.fullmatch(row[0])]
+
+
+def create_view(table: str) -> None:
+    """
+    Creates the <table>_all view with all trades of the trade table and its
+    archive tables, without the opening balance rows.
+    """
+    view = table + "_all"
+    select = ["select " + COLUMNS + " from " + name for name in archive_tables(table)]
+    select.append(
+        "select " + COLUMNS + " from " + table + " where EXECID <> '%s'" % BALANCE
+    )
+    var.cursor_sqlite.execute("DROP VIEW IF EXISTS " + view)
+    var.cursor_sqlite.execute(
+        "CREATE VIEW " + view + " AS " + " union all ".join(select)
+    )
+
+
+def _closed_until(table: str, horizon: str) -> dict:
+    """
+    For every (ACCOUNT, MARKET, EMI, SYMBOL) finds the last trade older
+    than the horizon after which the position was zero.
+
+    Returns
+    -------
+    dict
+        The key is (ACCOUNT, MARKET, EMI, SYMBOL), the value is (TTIME, ID)
+        of that trade.
+    """
+    rows = var.cursor_sqlite.execute(
+        "select ID, ACCOUNT, MARKET, EMI, SYMBOL, TTIME, sum(QTY) over "
+        + "(partition by ACCOUNT, MARKET, EMI, SYMBOL order by TTIME, ID) POS "
+        + "from "
+        + table
+        + " where SIDE <> 'Fund' and EXECID <> ? and TTIME < ? "
+        + "order by TTIME, ID",
+        (BALANCE, horizon),
+    ).fetchall()
+    res = dict()
+    for row in rows:
+        if round(row[6] or 0, 8) == 0:
+            res[(row[1], row[2], row[3], row[4])] = (row[5], row[0])
+
+    return res
+
+
+def _roll_up(table: str, side: str) -> None:
+    """
+    Adds the totals of the rows listed in the archive_ids temporary table to
+    the opening balance rows, creating them when necessary.
+    """
+    totals = var.cursor_sqlite.execute(
+        "select ACCOUNT, MARKET, EMI, SYMBOL, max(CURRENCY), max(TICKER), "
+        + "max(CATEGORY), sum(abs(QTY)), sum(SUMREAL), sum(COMMISS), "
+        + "max(TTIME) from "
+        + table
+        + " where ID in (select ID from archive_ids) "
+        + "group by ACCOUNT, MARKET, EMI, SYMBOL"
+    ).fetchall()
+    volume = 0 if side == "Fund" else 1
+    for row in totals:
+        key = (row[0], row[1], row[2], row[3])
+        updated = var.cursor_sqlite.execute(
+            "update "
+            + table
+            + " set QTY_REST = QTY_REST + ?, SUMREAL = SUMREAL + ?, "
+            + "COMMISS = COMMISS + ?, TTIME = max(TTIME, ?) where ID = "
+            + "(select min(ID) from "
+            + table
+            + " where EXECID = ? and SIDE = ? and ACCOUNT = ? and MARKET = ? "
+            + "and EMI = ? and SYMBOL = ?)",
+            (row[7] * volume, row[8], row[9], row[10], BALANCE, side) + key,
+        ).rowcount
+        if not updated:
+            var.cursor_sqlite.execute(
+                "insert into "
+                + table
+                + " (EXECID, EMI, REFER, MARKET, CURRENCY, SYMBOL, TICKER, "
+                + "CATEGORY, SIDE, QTY, QTY_REST, PRICE, THEOR_PRICE, "
+                + "TRADE_PRICE, SUMREAL, COMMISS, TTIME, CLORDID, ACCOUNT) "
+                + "VALUES (?, ?, '', ?, ?, ?, ?, ?, ?, 0, ?, 0, 0, 0, ?, ?, ?, "
+                + "0, ?)",
+                (
+                    BALANCE,
+                    row[2],
+                    row[1],
+                    row[4],
+                    row[3],
+                    row[5],
+                    row[6],
+                    side,
+                    row[7] * volume,
+                    row[8],
+                    row[9],
+                    row[10],
+                    row[0],
+                ),
+            )
+
+
+def _move(table: str) -> int:
+    """
+    Moves the rows listed in the archive_ids temporary table into the
+    monthly archive tables and returns the number of rows moved.
+    """
+    months = var.cursor_sqlite.execute(
+        "select distinct "
+        + MONTH
+        + " from "
+        + table
+        + " where ID in (select ID from archive_ids)"
+    ).fetchall()
+    for (month,) in months:
+        archive = table + "_" + str(month)
+        var.cursor_sqlite.execute(
+            "CREATE TABLE IF NOT EXISTS "
+            + archive
+            + " AS SELECT "
+            + COLUMNS
+            + " FROM "
+            + table
+            + " WHERE 0"
+        )
+        var.cursor_sqlite.execute(
+            "insert into "
+            + archive
+            + " select "
+            + COLUMNS
+            + " from "
+            + table
+            + " where ID in (select ID from archive_ids) and "
+            + MONTH
+            + " = ?",
+            (month,),
+        )
+
+    return var.cursor_sqlite.execute(
+        "delete from " + table + " where ID in (select ID from archive_ids)"
+    ).rowcount
+
+
+def archive_trades(table: str, days: int) -> int:
+    """
+    Moves trades older than ``days`` into the archive tables. Trades are
+    moved only up to the last moment when the position of the EMI and
+    symbol was closed, so open positions keep all their trades in the
+    trade table. Funding rows older than ``days`` are always moved.
+
+    Returns
+    -------
+    int
+        Number of rows moved.
+    """
+    horizon = datetime.now(tz=timezone.utc) - timedelta(days=days)
+    horizon = horizon.strftime("%Y-%m-%d %H:%M:%S.%f")
+    moved = 0
+    with var.sql_lock:
+        try:
+            var.cursor_sqlite.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS archive_ids "
+                + "(ID INTEGER PRIMARY KEY)"
+            )
+            var.cursor_sqlite.execute("delete from archive_ids")
+            for key, (ttime, num) in _closed_until(table, horizon).items():
+                var.cursor_sqlite.execute(
+                    "insert into archive_ids select ID from "
+                    + table
+                    + " where SIDE <> 'Fund' and EXECID <> ? and ACCOUNT = ? "
+                    + "and MARKET = ? and EMI = ? and SYMBOL = ? and "
+                    + "(TTIME < ? or (TTIME = ? and ID <= ?)) and "
+                    + MONTH
+                    + " is not null",
+                    (BALANCE,) + key + (ttime, ttime, num),
+                )
+            _roll_up(table, side=BALANCE)
+            moved += _move(table)
+            var.cursor_sqlite.execute("delete from archive_ids")
+            var.cursor_sqlite.execute(
+                "insert into archive_ids select ID from "
+                + table
+                + " where SIDE = 'Fund' and EXECID <> ? and TTIME < ? and "
+                + MONTH
+                + " is not null",
+                (BALANCE, horizon),
+            )
+            _roll_up(table, side="Fund")
+            moved += _move(table)
+            var.cursor_sqlite.execute("delete from archive_ids")
+            create_view(table)
+            var.connect_sqlite.commit()
+        except Exception as error:
+            var.connect_sqlite.rollback()
+            var.logger.error("Sqlite Error: archive " + table + ": " + str(error))
+            return 0
+
+    return moved
+
+
+def archive_update() -> None:
+    """
+    Archives the trade tables every var.archive_interval seconds while
+    var.archive_days is set. Runs in its own thread, see connect.py. The
+    first run is made by common/init.py at startup.
+    """
+    while var.archive_update_active:
+        Schedule.event.wait(var.archive_interval)
+        if var.archive_update_active and var.archive_days:
+            for table in (var.database_real, var.database_test):
+                archive_trades(table, days=var.archive_days)
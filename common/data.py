@@ -2,6 +2,7 @@ from collections import OrderedDict
 from datetime import datetime
 from typing import Any, Iterable, Union
 
+from common.orderbook import BookSide
 from common.variables import Variables as var
 
 
@@ -23,18 +24,20 @@ class Instrument:
 
     Parameters
     -----------
-    asks: list
-        Asks. The elements are sorted by price in ascending order. There can
-        only be one element if the ORDER_BOOK_DEPTH in the .env file is
-        defined as ``quote``.
+    asks: BookSide
+        Asks. The levels are sorted by price in ascending order. There can
+        only be one level if the ORDER_BOOK_DEPTH in the .env file is
+        defined as ``quote``. asks[0][0] is the first ask price, the same
+        as asks.best_price.
     avgEntryPrice: [float, str]
         Average entry price.
     baseCoin: str
         Base coin.
-    bids: list
-        Bids. The element is sorted by price in descending order. There can
-        only be one element if the ORDER_BOOK_DEPTH in the .env file is
-        defined as ``quote``.
+    bids: BookSide
+        Bids. The levels are sorted by price in descending order. There can
+        only be one level if the ORDER_BOOK_DEPTH in the .env file is
+        defined as ``quote``. bids[0][0] is the first bid price, the same
+        as bids.best_price.
     category: str
         Possible categories:
         Bitmex:
@@ -129,10 +132,10 @@ class Instrument:
         exchanges it is equal to 1.
     """
 
-    asks: list = []
+    asks: BookSide
     avgEntryPrice: float = var.DASH
     baseCoin: str
-    bids: list = []
+    bids: BookSide
     category: str
     confirm_subscription: set
     currentQty: float = 0
@@ -223,6 +226,10 @@ class BotData:
     iter: int = 0
     strategy_log: str
     multitrade: str = ""
+    run_count: int = 0
+    run_time: float = 0
+    run_time_max: float = 0
+    overruns: int = 0
 
     def __iter__(self):
         return Ret.iter(self)
@@ -241,7 +248,10 @@ class MetaInstrument(type):
         if name not in self.market:
             self.market[name] = OrderedDict()
         if item not in self.market[name]:
-            self.market[name][item] = Instrument()
+            instrument = Instrument()
+            instrument.asks = BookSide()
+            instrument.bids = BookSide()
+            self.market[name][item] = instrument
 
         return self.market[name][item]
 
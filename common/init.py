@@ -10,6 +10,7 @@ import services as service
 from api.api import WS
 from api.init import Variables
 from api.setup import Markets
+from common import archive
 from common.variables import Variables as var
 from display.functions import info_display
 from display.variables import TreeTable
@@ -130,18 +131,12 @@ class Init(WS, Variables):
         if isinstance(his_data, list):
             if his_data:
                 while his_data:
-                    for row in his_data:
-                        data = service.select_database(  # read_database
-                            "select EXECID from %s where EXECID='%s' and account=%s and market='%s'"
-                            % (
-                                var.database_table,
-                                row["execID"],
-                                self.user_id,
-                                self.name,
-                            ),
-                        )
-                        if not data:
-                            Function.transaction(self, row=row, info="History")
+                    # Rows are checked against the execIDs in memory.
+
+                    for row in service.new_executions(
+                        his_data, account=self.user_id, market=self.name
+                    ):
+                        Function.transaction(self, row=row, info="History")
                     last_history_time = his_data[-1]["transactTime"]
                     if not self.logNumFatal:
                         set_key(
@@ -181,8 +176,9 @@ class Init(WS, Variables):
         """
         data = service.select_database(
             "select SYMBOL, TICKER, CATEGORY from "
-            + "%s where ACCOUNT=%s and MARKET='%s' group by SYMBOL, CATEGORY"
-            % (var.database_table, self.user_id, self.name),
+            + "%s where ACCOUNT = ? and MARKET = ? group by SYMBOL, CATEGORY"
+            % var.database_table,
+            params=(self.user_id, self.name),
         )
         if isinstance(data, list):
             symbols = list(map(lambda x: (x["SYMBOL"], self.name), data))
@@ -198,15 +194,13 @@ class Init(WS, Variables):
             sql = (
                 "select DISTINCT(CURRENCY) from "
                 + var.database_table
-                + " where MARKET = '"
-                + self.name
-                + "' AND ACCOUNT = "
-                + str(self.user_id)
+                + " where MARKET = ? AND ACCOUNT = ?"
             )
-            data = service.select_database(sql)
+            data = service.select_database(sql, params=(self.name, self.user_id))
             for cur in data:
                 currency = cur["CURRENCY"]
                 union = ""
+                params = list()
                 sql = (
                     "select sum(commiss) commiss, sum(sumreal) sumreal, "
                     + "sum(funding) funding from ("
@@ -219,33 +213,23 @@ class Init(WS, Variables):
                         + "IFNULL(sum(SUMREAL),0.0) sumreal, IFNULL((select "
                         + "sum(COMMISS) from "
                         + var.database_table
-                        + " where SIDE = 'Fund' and ACCOUNT = "
-                        + str(self.user_id)
-                        + " and MARKET = '"
-                        + self.name
-                        + "' and CURRENCY = '"
-                        + currency
-                        + "' and SYMBOL = '"
-                        + symbol[0]
-                        + "' and CATEGORY = '"
-                        + instrument.category
-                        + "'),0.0) funding from "
+                        + " where SIDE = 'Fund' and ACCOUNT = ? and MARKET = ? "
+                        + "and CURRENCY = ? and SYMBOL = ? and CATEGORY = ?)"
+                        + ",0.0) funding from "
                         + var.database_table
-                        + " where SIDE <> 'Fund' and ACCOUNT = "
-                        + str(self.user_id)
-                        + " and MARKET = '"
-                        + self.name
-                        + "' and CURRENCY = '"
-                        + currency
-                        + "' and SYMBOL = '"
-                        + symbol[0]
-                        + "' and CATEGORY = '"
-                        + instrument.category
-                        + "'"
+                        + " where SIDE <> 'Fund' and ACCOUNT = ? and MARKET = ? "
+                        + "and CURRENCY = ? and SYMBOL = ? and CATEGORY = ?"
                     )
+                    params += [
+                        self.user_id,
+                        self.name,
+                        currency,
+                        symbol[0],
+                        instrument.category,
+                    ] * 2
                     union = "union "
                 sql += ") T"
-                data = service.select_database(sql)
+                data = service.select_database(sql, params=params)
                 settlCurrency = (currency, self.name)
                 self.Result[settlCurrency].commission = float(data[0]["commiss"])
                 self.Result[settlCurrency].funding = float(data[0]["funding"])
@@ -265,7 +249,7 @@ class Init(WS, Variables):
             emi_orders_copy = orders.copy()
             for clOrdID, order in emi_orders_copy.items():
                 if order["market"] == self.name:
-                    del var.orders[emi][clOrdID]
+                    service.remove_order(emi=emi, clOrdID=clOrdID)
 
     def load_orders(self: Markets, myOrders: list) -> None:
         """
@@ -303,15 +287,12 @@ class Init(WS, Variables):
                 "select ID, EMI, SYMBOL, TICKER, CATEGORY, MARKET, SIDE, QTY,"
                 + "PRICE, TTIME, COMMISS from "
                 + var.database_table
-                + " where SIDE = 'Fund' and ACCOUNT = "
-                + str(self.user_id)
-                + " and MARKET = '"
-                + self.name
-                + "' "
-                + "order by TTIME desc limit "
-                + str(disp.table_limit)
+                + " where SIDE = 'Fund' and EXECID <> 'Bal' and ACCOUNT = ? "
+                + "and MARKET = ? order by TTIME desc limit ?"
+            )
+            data = service.select_database(
+                sql, params=(self.user_id, self.name, disp.table_limit)
             )
-            data = service.select_database(sql)
             rows = list()
             for val in data:
                 val["SYMBOL"] = (val["SYMBOL"], self.name)
@@ -332,15 +313,12 @@ class Init(WS, Variables):
                 "select ID, EMI, SYMBOL, TICKER, CATEGORY, MARKET, SIDE, ABS(QTY) as QTY,"
                 + "TRADE_PRICE, TTIME, COMMISS, SUMREAL from "
                 + var.database_table
-                + " where SIDE <> 'Fund' and ACCOUNT = "
-                + str(self.user_id)
-                + " and MARKET = '"
-                + self.name
-                + "' "
-                + "order by TTIME desc limit "
-                + str(disp.table_limit)
+                + " where SIDE not in ('Fund', 'Bal') and ACCOUNT = ? "
+                + "and MARKET = ? order by TTIME desc limit ?"
+            )
+            data = service.select_database(
+                sql, params=(self.user_id, self.name, disp.table_limit)
             )
-            data = service.select_database(sql)
             rows = list()
             for val in data:
                 val["SYMBOL"] = (val["SYMBOL"], self.name)
@@ -363,9 +341,14 @@ class Init(WS, Variables):
 
 def setup_database_connecion() -> None:
     try:
-        var.connect_sqlite = sqlite3.connect(var.db_sqlite, check_same_thread=False)
+        var.connect_sqlite = sqlite3.connect(
+            var.db_sqlite,
+            check_same_thread=False,
+            cached_statements=var.database_statement_cache,
+        )
         var.connect_sqlite.row_factory = sqlite3.Row
         var.cursor_sqlite = var.connect_sqlite.cursor()
+        service.set_pragmas(var.connect_sqlite)
         var.error_sqlite = Error
 
         sql_create_robots = """
@@ -406,8 +389,11 @@ def setup_database_connecion() -> None:
         var.cursor_sqlite.execute(sql_create_robots)
         var.cursor_sqlite.execute(sql_create_expired)
         var.cursor_sqlite.execute(sql_create_backtest)
-        create_table_for_trades(var.database_real)
-        create_table_for_trades(var.database_test)
+        rebuild = list()
+        for table_name in (var.database_real, var.database_test):
+            create_table_for_trades(table_name)
+            if create_summary_for_trades(table_name):
+                rebuild.append(table_name)
         var.cursor_sqlite.execute(
             "CREATE INDEX IF NOT EXISTS %s_MARKET_SYMBOL ON %s (MARKET, SYMBOL)"
             % (var.expired_table, var.expired_table)
@@ -417,6 +403,13 @@ def setup_database_connecion() -> None:
             % (var.backtest_table, var.backtest_table)
         )
         var.connect_sqlite.commit()
+        for table_name in rebuild:
+            service.rebuild_summary(table_name)
+        for table_name in (var.database_real, var.database_test):
+            if var.archive_days:
+                archive.archive_trades(table_name, days=var.archive_days)
+            archive.create_view(table_name)
+        var.connect_sqlite.commit()
 
     except Exception as error:
         var.logger.error(error)
@@ -478,3 +471,105 @@ def create_table_for_trades(table_name):
     except Exception as error:
         var.logger.error(error)
         raise
+
+
+def create_summary_for_trades(table_name) -> bool:
+    """
+    Creates the <table_name>_summary table with the totals of the trade
+    table by ACCOUNT, MARKET, EMI, SYMBOL and the triggers that keep it up
+    to date on every insert, update and delete of trade rows.
+
+    Returns
+    -------
+    bool
+        True if the summary table did not exist and has to be filled with
+        service.rebuild_summary().
+    """
+    summary = table_name + "_summary"
+    # "is" instead of "=", so that rows with NULL in the key are matched.
+    key = (
+        "ACCOUNT is {row}.ACCOUNT and MARKET is {row}.MARKET and "
+        + "EMI is {row}.EMI and SYMBOL is {row}.SYMBOL"
+    )
+    insert = """
+        INSERT INTO {summary} (ACCOUNT, MARKET, EMI, SYMBOL, TICKER, CATEGORY,
+        CURRENCY, CNT, POS, VOL, SUMREAL, COMMISS, FUNDING)
+        SELECT NEW.ACCOUNT, NEW.MARKET, NEW.EMI, NEW.SYMBOL, NEW.TICKER,
+        NEW.CATEGORY, NEW.CURRENCY, 0, 0, 0, 0, 0, 0
+        WHERE NOT EXISTS (SELECT 1 FROM {summary} WHERE {key});
+        UPDATE {summary} SET CNT = CNT + 1,
+        POS = POS + case when NEW.SIDE = 'Fund' then 0 else NEW.QTY end,
+        VOL = VOL + case when NEW.SIDE = 'Fund' then 0 when NEW.SIDE = 'Bal'
+        then NEW.QTY_REST else abs(NEW.QTY) end,
+        SUMREAL = SUMREAL + case when NEW.SIDE = 'Fund' then 0 else NEW.SUMREAL end,
+        COMMISS = COMMISS + case when NEW.SIDE = 'Fund' then 0 else NEW.COMMISS end,
+        FUNDING = FUNDING + case when NEW.SIDE = 'Fund' then NEW.COMMISS else 0 end,
+        LTIME = max(ifnull(LTIME, ''), ifnull(NEW.TTIME, ''))
+        WHERE {key};""".format(
+        summary=summary, key=key.format(row="NEW")
+    )
+    delete = """
+        UPDATE {summary} SET CNT = CNT - 1,
+        POS = POS - case when OLD.SIDE = 'Fund' then 0 else OLD.QTY end,
+        VOL = VOL - case when OLD.SIDE = 'Fund' then 0 when OLD.SIDE = 'Bal'
+        then OLD.QTY_REST else abs(OLD.QTY) end,
+        SUMREAL = SUMREAL - case when OLD.SIDE = 'Fund' then 0 else OLD.SUMREAL end,
+        COMMISS = COMMISS - case when OLD.SIDE = 'Fund' then 0 else OLD.COMMISS end,
+        FUNDING = FUNDING - case when OLD.SIDE = 'Fund' then OLD.COMMISS else 0 end,
+        LTIME = (select max(TTIME) from {table} where {key})
+        WHERE {key};
+        DELETE FROM {summary} WHERE {key} and CNT <= 0;""".format(
+        summary=summary, table=table_name, key=key.format(row="OLD")
+    )
+    try:
+        var.cursor_sqlite.execute(
+            "select name from sqlite_master where type = 'table' and name = ?",
+            (summary,),
+        )
+        exists = var.cursor_sqlite.fetchone() is not None
+        var.cursor_sqlite.execute(
+            """
+        CREATE TABLE IF NOT EXISTS %s (
+        ACCOUNT int DEFAULT 0,
+        MARKET varchar(20) DEFAULT NULL,
+        EMI varchar(20) DEFAULT NULL,
+        SYMBOL varchar(40) DEFAULT NULL,
+        TICKER varchar(40) DEFAULT NULL,
+        CATEGORY varchar(20) DEFAULT NULL,
+        CURRENCY varchar(10) DEFAULT NULL,
+        CNT int DEFAULT 0,
+        POS decimal(20,8) DEFAULT 0,
+        VOL decimal(20,8) DEFAULT 0,
+        SUMREAL decimal(30,12) DEFAULT 0,
+        COMMISS decimal(30,16) DEFAULT 0,
+        FUNDING decimal(30,16) DEFAULT 0,
+        LTIME datetime DEFAULT NULL,
+        PRIMARY KEY (ACCOUNT, MARKET, EMI, SYMBOL))"""
+            % summary
+        )
+        var.cursor_sqlite.execute(
+            "CREATE INDEX IF NOT EXISTS %s_SUMMARY_KEY ON %s "
+            "(ACCOUNT, MARKET, EMI, SYMBOL, TTIME)" % (table_name, table_name)
+        )
+        for trigger in ("insert", "delete", "update"):
+            var.cursor_sqlite.execute(
+                "DROP TRIGGER IF EXISTS %s_%s" % (summary, trigger)
+            )
+        var.cursor_sqlite.execute(
+            "CREATE TRIGGER %s_insert AFTER INSERT ON %s BEGIN %s END"
+            % (summary, table_name, insert)
+        )
+        var.cursor_sqlite.execute(
+            "CREATE TRIGGER %s_delete AFTER DELETE ON %s BEGIN %s END"
+            % (summary, table_name, delete)
+        )
+        var.cursor_sqlite.execute(
+            "CREATE TRIGGER %s_update AFTER UPDATE OF ACCOUNT, MARKET, EMI, "
+            "SYMBOL, SIDE, QTY, QTY_REST, SUMREAL, COMMISS, TTIME ON %s "
+            "BEGIN %s %s END" % (summary, table_name, delete, insert)
+        )
+    except Exception as error:
+        var.logger.error(error)
+        raise
+
+    return not exists
@@ -0,0 +1,355 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Union
+
+
+class KlineStore:
+    """
+    Columnar binary storage of closed klines for one symbol and one
+    timeframe of a particular market.
+
+    The file consists of a fixed size header followed by one block per
+    column. Each block has room for ``capacity`` values of 8 bytes, so
+    every column is a contiguous little-endian array that can be read
+    directly from the memory map, for example with ``array.frombytes()``
+    or ``numpy.frombuffer(..., offset=...)``. New klines are written into
+    the free slots of each column in place. When the file is full, its
+    capacity is doubled and the columns are moved to the new positions,
+    see _grow().
+
+    Header: magic (8s), version (q), capacity (q), count (q), generation (q).
+
+    A bot running in a separate process, see botinit/worker.py, opens the
+    file with ``readonly=True`` while the main process writes it. Appended
+    klines become visible when the count in the header is updated, after
+    the values are written. The generation is odd while the columns are
+    moved by _grow() and changes when the store is cleared, so a reader
+    repeats a read if the generation differs before and after it.
+    """
+
+    MAGIC = b"TMKLINES"
+    VERSION = 1
+    HEADER = struct.Struct("<8sqqqq")
+    COLUMNS = (
+        ("timestamp", "q"),
+        ("date", "q"),
+        ("time", "q"),
+        ("open_bid", "d"),
+        ("open_ask", "d"),
+        ("hi", "d"),
+        ("lo", "d"),
+        ("funding", "d"),
+    )
+    ITEMSIZE = 8
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, filename: str, readonly: bool = False) -> None:
+        self.filename = filename
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.capacity = 0
+        self.count = 0
+        self.generation = 0
+        self._file = None
+        self._mm = None
+        if readonly:
+            self._attach()
+        else:
+            self._open()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _open(self) -> None:
+        backup = self.filename + ".grow"
+        exists = os.path.isfile(self.filename)
+        if exists and os.path.getsize(self.filename) >= self.HEADER.size:
+            self._file = open(self.filename, "r+b")
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+            magic, version, capacity, count, generation = self.HEADER.unpack_from(
+                self._mm, 0
+            )
+            if (
+                magic == self.MAGIC
+                and version == self.VERSION
+                and 0 <= count <= capacity
+                and len(self._mm) >= self._size(capacity)
+            ):
+                if not generation % 2:
+                    self.capacity, self.count = capacity, count
+                    self.generation = generation
+                    if os.path.isfile(backup):
+                        os.remove(backup)
+                    return
+                if os.path.isfile(backup):
+                    # _grow() was interrupted while moving the columns. The
+                    # file is restored from the copy made before the move.
+                    self.close()
+                    os.replace(backup, self.filename)
+                    return self._open()
+            self.close()
+        if exists:
+            # Not a kline store that can be read. It is kept aside rather
+            # than overwritten.
+            os.replace(self.filename, self.filename + ".old")
+        self._create(capacity=self.INITIAL_CAPACITY)
+
+    def _attach(self) -> None:
+        """
+        Maps the file read-only in a process that does not write it. The
+        file is never created here, the store stays empty until the main
+        process creates it.
+        """
+        if os.path.isfile(self.filename):
+            if os.path.getsize(self.filename) >= self.HEADER.size:
+                self._file = open(self.filename, "rb")
+                self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.generation = -1
+                self._sync(update_count=True)
+
+    def _sync(self, update_count: bool = False) -> int:
+        """
+        Reads the header of a read-only store. Waits while the main process
+        moves the columns, maps the file again if it has grown and takes
+        the new count if the generation has changed.
+
+        Returns
+        -------
+        int
+            The generation the capacity and count belong to.
+        """
+        while True:
+            magic, version, capacity, count, generation = self.HEADER.unpack_from(
+                self._mm, 0
+            )
+            if magic != self.MAGIC or version != self.VERSION:
+                self.capacity = self.count = 0
+                return generation
+            if not generation % 2:
+                break
+            time.sleep(0.001)
+        if len(self._mm) < self._size(capacity):
+            self._mm.close()
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if update_count or generation != self.generation:
+            self.count = count
+        self.capacity, self.generation = capacity, generation
+
+        return generation
+
+    def _size(self, capacity: int) -> int:
+        return self.HEADER.size + len(self.COLUMNS) * capacity * self.ITEMSIZE
+
+    def _offset(self, num: int, capacity: int = None) -> int:
+        """
+        Offset of the column number ``num`` from the beginning of the file.
+        """
+        if capacity is None:
+            capacity = self.capacity
+
+        return self.HEADER.size + num * capacity * self.ITEMSIZE
+
+    def _create(self, capacity: int) -> None:
+        with open(self.filename, "wb") as f:
+            f.truncate(self._size(capacity))
+        self._file = open(self.filename, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        self.capacity, self.count = capacity, 0
+        self._write_header()
+
+    def _write_header(self) -> None:
+        self.HEADER.pack_into(
+            self._mm,
+            0,
+            self.MAGIC,
+            self.VERSION,
+            self.capacity,
+            self.count,
+            self.generation,
+        )
+
+    def _grow(self, required: int) -> None:
+        """
+        Doubles the capacity until ``required`` klines fit. The file is
+        copied to ``<filename>.grow`` first. Then the generation is made odd
+        and the columns are moved starting from the last one, so that a
+        column is only copied over the space of the columns already moved.
+        If Tmatic stops before the header with the new capacity is written,
+        _open() finds the odd generation and restores the copy.
+        """
+        capacity = self.capacity
+        while capacity < required:
+            capacity *= 2
+        backup = self.filename + ".grow"
+        with open(backup, "wb") as f:
+            f.write(self._mm[: self._size(self.capacity)])
+            f.flush()
+            os.fsync(f.fileno())
+        self.generation += 1
+        self._write_header()
+        self._mm.flush()
+        self._mm.resize(self._size(capacity))
+        size = self.count * self.ITEMSIZE
+        for num in reversed(range(1, len(self.COLUMNS))):
+            self._mm.move(self._offset(num, capacity=capacity), self._offset(num), size)
+        self.capacity = capacity
+        self.generation += 1
+        self._write_header()
+        self._mm.flush()
+        os.remove(backup)
+
+    def append(self, rows: Union[dict, list], funding: float = None) -> None:
+        """
+        Adds klines to the end of the file.
+
+        Parameters
+        ----------
+        rows: dict | list
+            One kline or a list of klines with the keys "datetime", "date",
+            "time", "open_bid", "open_ask", "hi", "lo".
+        funding: float
+            Funding rate recorded for every kline. If omitted, the value is
+            taken from the "funding" key of the kline.
+        """
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not rows:
+            return
+        with self.lock:
+            if self.count + len(rows) > self.capacity:
+                self._grow(required=self.count + len(rows))
+            for num, (name, typecode) in enumerate(self.COLUMNS):
+                if name == "timestamp":
+                    values = [int(row["datetime"].timestamp()) for row in rows]
+                elif name == "funding" and funding is not None:
+                    values = [float(funding)] * len(rows)
+                elif name == "funding":
+                    values = [float(row.get("funding") or 0) for row in rows]
+                else:
+                    values = [row[name] for row in rows]
+                start = self._offset(num) + self.count * self.ITEMSIZE
+                data = array(typecode, values).tobytes()
+                self._mm[start : start + len(data)] = data
+            self.count += len(rows)
+            self._write_header()
+
+    def column(self, name: str, start: int = 0) -> array:
+        """
+        Returns a copy of the column starting from the kline number
+        ``start``. Negative values count from the end.
+        """
+        for num, (col, typecode) in enumerate(self.COLUMNS):
+            if col == name:
+                break
+        else:
+            raise KeyError(name)
+        with self.lock:
+            while True:
+                values = array(typecode)
+                if self.readonly:
+                    if self._mm is None:
+                        return values
+                    generation = self._sync()
+                first = max(self.count + start, 0) if start < 0 else start
+                first = min(first, self.count)
+                begin = self._offset(num)
+                values.frombytes(
+                    self._mm[
+                        begin
+                        + first * self.ITEMSIZE : begin
+                        + self.count * self.ITEMSIZE
+                    ]
+                )
+                if not self.readonly:
+                    break
+                if self.HEADER.unpack_from(self._mm, 0)[4] == generation:
+                    break
+
+        return values
+
+    def rows(self, start: int = 0) -> list:
+        """
+        Returns klines starting from the kline number ``start`` as a list
+        of dictionaries in the same format as the klines dictionary of the
+        market.
+        """
+        columns = {name: self.column(name, start=start) for name, _ in self.COLUMNS}
+        # A read-only store may get new klines between the columns.
+        length = min(len(values) for values in columns.values())
+        res = list()
+        for num, timestamp in enumerate(columns["timestamp"][:length]):
+            res.append(
+                {
+                    "date": columns["date"][num],
+                    "time": columns["time"][num],
+                    "open_bid": columns["open_bid"][num],
+                    "open_ask": columns["open_ask"][num],
+                    "hi": columns["hi"][num],
+                    "lo": columns["lo"][num],
+                    "funding": columns["funding"][num],
+                    "datetime": datetime.fromtimestamp(timestamp, tz=timezone.utc),
+                }
+            )
+
+        return res
+
+    def last_time(self) -> Union[datetime, None]:
+        """
+        Returns the time of the latest stored kline or None if the file is
+        empty.
+        """
+        timestamps = self.column("timestamp", start=-1)
+        if timestamps:
+            return datetime.fromtimestamp(timestamps[0], tz=timezone.utc)
+
+    def refresh(self) -> None:
+        """
+        Reads the header again in a read-only store after the file has been
+        written by the main Tmatic process, see botinit/worker.py.
+        """
+        with self.lock:
+            if self._mm is None:
+                self._attach()
+            else:
+                self._sync(update_count=True)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.count = 0
+            self.generation += 2
+            self._write_header()
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Storage:
+    """
+    Keeps one open KlineStore per file.
+    """
+
+    stores = dict()
+    lock = threading.Lock()
+
+    def get(filename: str) -> KlineStore:
+        with Storage.lock:
+            if filename not in Storage.stores:
+                Storage.stores[filename] = KlineStore(filename)
+
+            return Storage.stores[filename]
+
+    def close() -> None:
+        with Storage.lock:
+            for store in Storage.stores.values():
+                store.close()
+            Storage.stores = dict()
@@ -0,0 +1,183 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterator, Union
+
+
+class BookSide:
+    """
+    One side of the order book of an instrument. Prices and sizes of the
+    levels are kept in preallocated arrays of doubles, the best level
+    first, and are overwritten in place on every update. best_price and
+    best_size are the top of the book, 0 if the side is empty.
+
+    For compatibility with the list of [price, size] lists it replaces,
+    the side supports len(), iteration and indexing: asks[0][0] is the
+    first ask price, and IndexError is raised beyond the last level.
+
+    The arrays support the buffer protocol, so NumPy can use them without
+    copying: numpy.frombuffer(instrument.asks.prices)[: len(instrument.asks)]
+
+    The levels are overwritten by the websocket thread while other threads
+    may read them. best_price and best_size are replaced together with the
+    count after each update, so they are safe to read at any time. Readers
+    of several levels should take a copy with levels(), which does not
+    raise IndexError if the side shrinks meanwhile.
+    """
+
+    def __init__(self, depth: int = 10) -> None:
+        self.prices = array("d", bytes(8 * depth))
+        self.sizes = array("d", bytes(8 * depth))
+        self.count = 0
+        self.best_price = 0.0
+        self.best_size = 0.0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, num: Union[int, slice]) -> Union[tuple, list]:
+        if isinstance(num, slice):
+            return self.levels()[num]
+        if num < 0:
+            num += self.count
+        if not 0 <= num < self.count:
+            raise IndexError("order book level out of range")
+
+        return (self.prices[num], self.sizes[num])
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self.levels())
+
+    def levels(self) -> list:
+        """
+        Returns a copy of the levels as a list of (price, size) tuples.
+        """
+        count = self.count
+
+        return list(zip(self.prices[:count], self.sizes[:count]))
+
+    def _reserve(self, depth: int) -> None:
+        if depth > len(self.prices):
+            extra = bytes(8 * (depth - len(self.prices)))
+            self.prices.frombytes(extra)
+            self.sizes.frombytes(extra)
+
+    def _set_count(self, count: int) -> None:
+        self.count = count
+        if count:
+            self.best_price = self.prices[0]
+            self.best_size = self.sizes[0]
+        else:
+            self.best_price = self.best_size = 0.0
+
+    def update(self, levels: list, divisor: float = 1) -> None:
+        """
+        Replaces the levels with [price, size] pairs sorted from the best
+        level. Sizes are divided by ``divisor``.
+        """
+        self._reserve(len(levels))
+        prices, sizes = self.prices, self.sizes
+        for num, (price, size) in enumerate(levels):
+            prices[num] = float(price)
+            sizes[num] = float(size) / divisor
+        self._set_count(len(levels))
+
+    def set_top(self, price: float, size: float) -> None:
+        """
+        Makes the side a single level, as for the quote stream.
+        """
+        self.prices[0] = price
+        self.sizes[0] = size
+        self._set_count(1)
+
+
+class OrderBook:
+    """
+    Price levels of one instrument maintained from a snapshot followed by
+    delta messages.
+
+    Each side keeps a dictionary price -> size and a sorted list of its
+    keys: asks by price, bids by negative price, so that the best level of
+    both sides is the first one. A delta costs a binary search per changed
+    level, and the best levels are read without sorting.
+
+    update_id is the identifier of the last applied message. Deltas must
+    follow each other without gaps, otherwise the book is marked as not
+    valid, and deltas should not be applied until the next snapshot.
+    """
+
+    def __init__(self) -> None:
+        self.asks = dict()
+        self.bids = dict()
+        self.ask_keys = list()
+        self.bid_keys = list()
+        self.update_id = 0
+        self.valid = False
+
+    def snapshot(self, asks: list, bids: list, update_id: int) -> None:
+        """
+        Replaces the book. The levels are [price, size] pairs, the values
+        may be strings.
+        """
+        self.asks = self._sizes(asks)
+        self.bids = self._sizes(bids)
+        self.ask_keys = sorted(self.asks)
+        self.bid_keys = sorted(-price for price in self.bids)
+        self.update_id = update_id
+        self.valid = True
+
+    def delta(self, asks: list, bids: list, update_id: int) -> bool:
+        """
+        Applies changed levels. A level with zero size is removed.
+
+        Returns
+        -------
+        bool
+            False if the update_id does not follow the previous one. In this
+            case the delta is not applied and the book is marked as not
+            valid until a new snapshot.
+        """
+        if update_id != self.update_id + 1:
+            self.valid = False
+            return False
+        self._apply(levels=asks, sizes=self.asks, keys=self.ask_keys, sign=1)
+        self._apply(levels=bids, sizes=self.bids, keys=self.bid_keys, sign=-1)
+        self.update_id = update_id
+
+        return True
+
+    def _sizes(self, levels: list) -> dict:
+        sizes = dict()
+        for price, size in levels:
+            size = float(size)
+            if size:
+                sizes[float(price)] = size
+
+        return sizes
+
+    def _apply(self, levels: list, sizes: dict, keys: list, sign: int) -> None:
+        for price, size in levels:
+            price, size = float(price), float(size)
+            if size:
+                if price not in sizes:
+                    keys.insert(bisect_left(keys, sign * price), sign * price)
+                sizes[price] = size
+            elif price in sizes:
+                del sizes[price]
+                del keys[bisect_left(keys, sign * price)]
+
+    def write(self, asks: BookSide, bids: BookSide, depth: int) -> None:
+        """
+        Copies the best ``depth`` levels of both sides to the instrument's
+        order book without sorting.
+        """
+        for side, keys, sizes, sign in (
+            (asks, self.ask_keys, self.asks, 1),
+            (bids, self.bid_keys, self.bids, -1),
+        ):
+            count = min(len(keys), depth)
+            side._reserve(count)
+            for num in range(count):
+                price = sign * keys[num]
+                side.prices[num] = price
+                side.sizes[num] = sizes[price]
+            side._set_count(count)
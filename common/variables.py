@@ -105,8 +105,8 @@ class Variables:
     error_sqlite = None
     last_order = int((time.time() - 1591000000) * 10)
     last_database_time = datetime(1900, 1, 1, 1, 1)
-    refresh_hour = datetime.now(tz=timezone.utc).hour
     bot_thread_active = dict()
+    bot_workers = 8
     queue_info = queue.Queue()
     queue_order = queue.Queue()
     queue_reload = queue.Queue()
@@ -114,8 +114,26 @@ class Variables:
     lock_kline_update = threading.Lock()
     lock_display = threading.Lock()
     sql_lock = threading.Lock()
+    queue_database = queue.Queue()
+    database_batch_size = 500
+    database_flush_interval = 0.2
+    database_read_connections = 4
+    database_read_wait = 0.5
+    database_statement_cache = 256
+    archive_days = 0
+    archive_interval = 86400
+    database_pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    }
     working_directory: str
     kline_update_active = True
+    indicator_update_active = True
+    indicator_prices = 1000
+    archive_update_active = True
     orders = dict()
     timeframe_human_format = OrderedDict(
         [
@@ -10,6 +10,8 @@ import services as service
 from api.api import WS
 from api.init import Setup
 from api.setup import Markets
+from botinit import process
+from common import archive
 from common.data import Bots, MetaInstrument
 from common.variables import Variables as var
 from display.bot_menu import bot_manager, insert_bot_log
@@ -25,6 +27,8 @@ settings = SettingsApp(disp.settings_page)
 disp.root.bind("<F3>", lambda event: terminal_reload(event))
 thread = threading.Thread(target=functions.kline_update)
 thread.start()
+threading.Thread(target=functions.indicator_update).start()
+threading.Thread(target=archive.archive_update).start()
 
 
 def setup(reload=False):
@@ -92,6 +96,7 @@ def setup(reload=False):
     for name in var.market_list:
         if Markets[name].name != "Fake":
             Markets[name].api_is_active = True
+    functions.wake_kline_update()
 
 
 def setup_market(ws: Markets, reload=False):
@@ -272,6 +277,7 @@ def refresh() -> None:
             bot_manager.create_bots_menu()
             botinit.setup_bots()
             ws.api_is_active = True
+            functions.wake_kline_update()
         while not var.queue_order.empty():
             """
             The queue thread-safely displays current orders that can be queued:
@@ -344,6 +350,7 @@ def refresh() -> None:
 def clear_params():
     var.market_list = []
     var.orders = dict()
+    service.clear_order_index()
     MetaInstrument.market = dict()
     var.rollup_symbol = "cancel"
 
@@ -373,6 +380,12 @@ def on_closing(root, refresh_var):
     root.destroy()
     service.close(Markets)
     var.kline_update_active = False
+    functions.wake_kline_update()
+    var.indicator_update_active = False
+    service.TopOfBook.event.set()
+    var.archive_update_active = False
+    archive.Schedule.event.set()
+    process.stop_all()
 
 
 def init_fake():
@@ -18,7 +18,9 @@ import functions
 import indicators
 import services as service
 from api.setup import Markets
+from botinit import process
 from botinit.variables import Variables as robo
+from common import archive
 from common.data import BotData, Bots
 from common.variables import Variables as var
 from display.messages import ErrorMessage
@@ -274,11 +276,8 @@ class SettingsApp:
             )
 
             import_bot_module(disp.bot_name, update=True)
-            qwr = (
-                "UPDATE robots SET"
-                + f" UPDATED = CURRENT_TIMESTAMP WHERE EMI = '{disp.bot_name}'"
-            )
-            err = service.update_database(query=qwr)
+            qwr = "UPDATE robots SET UPDATED = CURRENT_TIMESTAMP WHERE EMI = ?"
+            err = service.update_database(query=qwr, params=(disp.bot_name,))
             if err is None:
                 bot = Bots[disp.bot_name]
                 bot.updated = self.get_time()
@@ -460,10 +459,10 @@ class SettingsApp:
         def on_button(value: int) -> None:
             timefr = tuple(self.timeframes.keys())[value]
             qwr = (
-                f"UPDATE robots SET TIMEFR = '{timefr}'"
-                + f", UPDATED = CURRENT_TIMESTAMP WHERE EMI = '{bot_name}'"
+                "UPDATE robots SET TIMEFR = ?, UPDATED = CURRENT_TIMESTAMP "
+                + "WHERE EMI = ?"
             )
-            err = service.update_database(query=qwr)
+            err = service.update_database(query=qwr, params=(timefr, bot_name))
             if err is None:
                 bot.timefr = timefr
                 bot.updated = self.get_time()
@@ -531,25 +530,8 @@ class SettingsApp:
             if self.delete_warning(bot_name=bot_to_delete):
                 return
 
-            query_r = (
-                "UPDATE "
-                + var.database_real
-                + " SET EMI = '"
-                + bot_name
-                + "' WHERE EMI = '"
-                + bot_to_delete
-                + "'"
-            )
-            query_t = (
-                "UPDATE "
-                + var.database_test
-                + " SET EMI = '"
-                + bot_name
-                + "' WHERE EMI = '"
-                + bot_to_delete
-                + "'"
-            )
-            message = self.delete_all_bot_info(bot_to_delete, query_r, query_t, "Merge")
+            query = ("UPDATE {} SET EMI = ? WHERE EMI = ?", (bot_name, bot_to_delete))
+            message = self.delete_all_bot_info(bot_to_delete, query, "Merge")
             if message[0] is None:
                 message[1] = "The merge operation completed successfully."
             else:
@@ -700,24 +682,12 @@ class SettingsApp:
         def delete_bot(bot_name: str) -> None:
             if self.delete_warning(bot_name=bot_name):
                 return
-            query_r = (
-                "UPDATE "
-                + var.database_real
-                + " SET EMI = '' WHERE EMI = '"
-                + bot_name
-                + "'"
-            )
-            query_t = (
-                "UPDATE "
-                + var.database_test
-                + " SET EMI = '' WHERE EMI = '"
-                + bot_name
-                + "'"
-            )
-            message = self.delete_all_bot_info(bot_name, query_r, query_t, "Delete")
+            query = ("UPDATE {} SET EMI = '' WHERE EMI = ?", (bot_name,))
+            message = self.delete_all_bot_info(bot_name, query, "Delete")
             if message[0] is None:
                 message[1] = "The delete operation completed successfully."
                 values = ["" for _ in Header.name_bot]
+                TreeTable.bot_info.cache[0] = values
                 TreeTable.bot_info.update(row=0, values=values)
             else:
                 if message[1] == "":
@@ -729,6 +699,7 @@ class SettingsApp:
                         f"\n{message[0]}\n\nThe delete operation completed with errors."
                     )
                     values = ["" for _ in Header.name_bot]
+                    TreeTable.bot_info.cache[0] = values
                     TreeTable.bot_info.update(row=0, values=values)
             self.finish_operation(message[1])
 
@@ -780,6 +751,7 @@ class SettingsApp:
 
         self.switch(option="option")
         values = ["" for _ in Header.name_bot]
+        TreeTable.bot_info.cache[0] = values
         TreeTable.bot_info.update(row=0, values=values)
         tk.Label(
             self.brief_frame,
@@ -887,9 +859,11 @@ class SettingsApp:
             info_left.pack(fill="both", side="left")
             info_right.pack(fill="both", expand=True, side="left")
 
-    def delete_all_bot_info(
-        self, bot_name, query_r, query_t, type
-    ) -> Union[bool, None]:
+    def delete_all_bot_info(self, bot_name, query, type) -> Union[bool, None]:
+        """
+        The query is a template whose {} is replaced with the name of the
+        trade table and of each of its archive tables.
+        """
         message = ""
         err = None
         try:
@@ -907,17 +881,24 @@ class SettingsApp:
             if type == "Delete":
                 disp.bot_name = None
             message = f"Bot ``{bot_name}`` removed from Tmatic's memory."
-            err = service.update_database(query=query_r)
-            if err is None:
-                message += "\nDatabase table `" + var.database_real + "` updated."
-                err = service.update_database(query=query_t)
-                if err is None:
-                    message += "\nDatabase table `" + var.database_test + "` updated."
+            for table in (var.database_real, var.database_test):
+                with var.sql_lock:
+                    tables = [table] + archive.archive_tables(table)
+                for name in tables:
                     err = service.update_database(
-                        query=f"DELETE FROM robots WHERE EMI = '{bot_name}'"
+                        query=query[0].format(name), params=query[1]
                     )
-                    if err is None:
-                        message += f"\nBot ``{bot_name}`` deleted from the database."
+                    if err is not None:
+                        break
+                if err is not None:
+                    break
+                message += "\nDatabase table `" + table + "` updated."
+            if err is None:
+                err = service.update_database(
+                    query="DELETE FROM robots WHERE EMI = ?", params=(bot_name,)
+                )
+                if err is None:
+                    message += f"\nBot ``{bot_name}`` deleted from the database."
             bot_path = self.get_bot_path(bot_name)
             shutil.rmtree(str(bot_path))
             message += f"\nThe ``/{bot_name}/`` subdirectory erased."
@@ -926,6 +907,7 @@ class SettingsApp:
             disp.bot_event_prev = ""
             var.bot_thread_active[bot_name] = False
             del robo.run_bot[bot_name]
+            process.stop_process(bot_name)
             del self.modules[bot_name]
             del var.orders[bot_name]
             functions.remove_bot_klines(bot_name)
@@ -1027,7 +1009,8 @@ def update_bot_state(new_state: str, bot: BotData, update=False) -> Union[str, N
         Description of the error, or None if successful.
     """
     err = service.update_database(
-        query=f"UPDATE robots SET STATE = '{new_state}' WHERE EMI = '{bot.name}'"
+        query="UPDATE robots SET STATE = ? WHERE EMI = ?",
+        params=(new_state, bot.name),
     )
     if err is None:
         bot.state = new_state
@@ -1125,10 +1108,15 @@ def update_bot_info(bot_name: str) -> None:
         bot.timefr,
         bot.state,
         service.bot_error(bot=bot),
+        round(bot.run_time, 1),
+        round(bot.run_time_max, 1),
+        bot.overruns,
         bot.updated,
         bot.created,
     ]
-    TreeTable.bot_info.update(row=0, values=values)
+    if values != TreeTable.bot_info.cache.get(0):
+        TreeTable.bot_info.cache[0] = values
+        TreeTable.bot_info.update(row=0, values=values)
 
 
 def init_bot_trades(bot_name: str) -> None:
@@ -1157,12 +1145,10 @@ def init_bot_trades(bot_name: str) -> None:
             "select ID, EMI, SYMBOL, TICKER, CATEGORY, MARKET, SIDE, ABS(QTY) "
             + "as QTY, TRADE_PRICE, TTIME from "
             + var.database_table
-            + " where EMI == '"
-            + bot_name
-            + "' and SIDE <> 'Fund' order by TTIME desc limit "
-            + str(disp.table_limit)
+            + " where EMI = ? and SIDE not in ('Fund', 'Bal') "
+            + "order by TTIME desc limit ?"
         )
-        data = service.select_database(sql)
+        data = service.select_database(sql, params=(bot_name, disp.table_limit))
         indx_side = trade_treeTable[bot_name].title.index("SIDE")
         indx_market = trade_treeTable[bot_name].title.index("MARKET")
         line = False
@@ -1316,8 +1302,35 @@ def import_bot_module(bot_name: str, update=False) -> None:
                         "emi": bot_name,
                     }
                 )
+        process.stop_process(bot_name)
         try:
             robo.run_bot[bot_name] = bot_manager.modules[bot_name].run_bot
+            if getattr(bot_manager.modules[bot_name], "RUN_IN_PROCESS", False):
+                robo.run_bot[bot_name] = process.start_process(
+                    bot_name=bot_name, module=module
+                )
+        except process.BotProcessError as exception:
+            robo.run_bot[bot_name] = "No strategy"
+            message = ErrorMessage.BOT_LOADING_ERROR.format(
+                MODULE=module,
+                CLASS=exception.__class__.__name__,
+                EXCEPTION=str(exception),
+                BOT_NAME=bot_name,
+            )
+            var.logger.warning(message)
+            var.queue_info.put(
+                {
+                    "market": "",
+                    "message": message,
+                    "time": datetime.now(tz=timezone.utc),
+                    "warning": True,
+                    "emi": bot_name,
+                }
+            )
+            Bots[bot_name].error_message = {
+                "error_type": exception.__class__.__name__,
+                "message": message,
+            }
         except Exception:
             robo.run_bot[bot_name] = "No strategy"
         try:
@@ -1344,6 +1357,7 @@ def import_bot_module(bot_name: str, update=False) -> None:
             bot_manager.algo_dir + "/" + bot_name + "/strategy_" + tm + ".log"
         )
     else:
+        process.stop_process(bot_name)
         if bot_name in robo.run_bot:
             del robo.run_bot[bot_name]
         if bot_name in robo.setup_bot:
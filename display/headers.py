@@ -83,6 +83,9 @@ class Header:
         "TIMEFR",
         "STATE",
         "ERRORS",
+        "RUN MS",
+        "MAX MS",
+        "OVERRUNS",
         "UPDATED",
         "CREATED",
     ]
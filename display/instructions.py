@@ -37,9 +37,9 @@
 #
 # Instrument parameters:
 #
-# btcusd.asks           Orderbook asks (list)
-# btcusd.bids           Orderbook bids (list)
-# btcusd.asks[0]        First ask price and volume (list)
+# btcusd.asks           Orderbook asks (BookSide, indexed like a list)
+# btcusd.bids           Orderbook bids (BookSide, indexed like a list)
+# btcusd.asks[0]        First ask price and volume (tuple)
 # btcusd.asks[0][0]     First ask price (float)
 # btcusd.asks[0][1]     First ask volume (float)
 # btcusd.category       Instrument category (str)
@@ -288,4 +288,19 @@
 #       instrument.sell(bot=bot, move=True, cancel=True)
 #
 #
+# 10. Running a bot in a separate process
+# ---------------------------------------
+#
+# If run_bot() takes a lot of CPU time, add RUN_IN_PROCESS = True to
+# strategy.py. run_bot() is then called in a separate process and does not
+# slow down the market data and the screen updates. Before every call it
+# receives the order books, klines, positions and orders of the bot.
+# buy(), sell(), remove(), replace() and set_limit() are carried out after
+# run_bot() is finished, therefore buy() and sell() return None.
+# setup_bot(), update_bot() and activate_bot() are still called in Tmatic
+# itself, so the variables they set are not visible to run_bot().
+#
+# RUN_IN_PROCESS = True
+#
+#
 #
@@ -28,6 +28,17 @@ class Message(str, Enum):
         "Already subscribed symbol {SKIPPED} skipped during websocket subscription "
         + "to {SYMBOL}."
     )
+    ORDERBOOK_RESYNC = (
+        "Orderbook {TOPIC}: update {UPDATE} does not follow {LAST}. Requesting "
+        + "a new snapshot."
+    )
+    ORDERBOOK_RESYNC_ERROR = (
+        "Orderbook {TOPIC}: {OP} request for a new snapshot failed: {ERROR}"
+    )
+    ORDERBOOK_RESYNC_FAILED = (
+        "Orderbook {TOPIC}: no snapshot after {NUMBER} attempts. Reconnecting to "
+        + "{MARKET}."
+    )
 
     def __str__(self) -> str:
         return self.value
@@ -1,10 +1,12 @@
+import heapq
+import math
 import re
 import threading
 import time
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from enum import Enum
 from random import randint
 from typing import Tuple, Union
 
@@ -17,6 +19,7 @@ from api.setup import Markets
 from api.variables import Variables
 from botinit.variables import Variables as robo
 from common.data import Bots, Instrument
+from common.klines import KlineStore, Storage
 from common.variables import Variables as var
 from display.functions import info_display
 from display.headers import Header
@@ -31,19 +34,7 @@ from display.variables import (
     TreeviewTable,
 )
 from display.variables import Variables as disp
-
-
-class SelectDatabase(str, Enum):
-    QWR = (
-        "select SYMBOL, TICKER, CATEGORY, EMI, POS, PNL, MARKET, TTIME from (select "
-        + "EMI, SYMBOL, TICKER, CATEGORY, sum(QTY) POS, sum(SUMREAL) PNL, MARKET, "
-        + "TTIME from {DATABASE_TABLE}"
-        + " where SIDE <> 'Fund' group by EMI, SYMBOL, "
-        + "MARKET) res where POS <> 0 order by SYMBOL desc;"
-    )
-
-    def __str__(self) -> str:
-        return self.value
+from indicators import BreakDown
 
 
 class Function(WS, Variables):
@@ -126,13 +117,9 @@ class Function(WS, Variables):
             qwr = (
                 "select * from "
                 + var.expired_table
-                + " where SYMBOL ='"
-                + symb
-                + "' and MARKET = '"
-                + self.name
-                + "';"
+                + " where SYMBOL = ? and MARKET = ?;"
             )
-            data = service.select_database(qwr)
+            data = service.select_database(qwr, params=(symb, self.name))
             if not data:
                 WS.get_instrument(self, ticker=ticker, category=category)
                 service.add_symbol_database(
@@ -144,29 +131,19 @@ class Function(WS, Variables):
                 service.set_symbol(instrument=instrument, data=data)
 
     def kline_data_filename(self: Markets, symbol: tuple, timefr: str) -> str:
-        return "data/" + symbol[0] + "_" + self.name + "_" + str(timefr) + ".txt"
+        return "data/" + symbol[0] + "_" + self.name + "_" + str(timefr) + ".kln"
 
-    def save_kline_data(self: Markets, row: dict, symbol: tuple, timefr: int) -> None:
+    def kline_store(self: Markets, symbol: tuple, timefr: str) -> KlineStore:
+        """
+        Returns the binary file with the closed klines of the instrument.
+        """
         filename = Function.kline_data_filename(self, symbol=symbol, timefr=timefr)
-        zero = (4 - len(str(row["time"]))) * "0"
-        data = (
-            str(row["date"])
-            + ";"
-            + str(zero)
-            + str(row["time"])
-            + ";"
-            + str(row["open_bid"])
-            + ";"
-            + str(row["open_ask"])
-            + ";"
-            + str(row["hi"])
-            + ";"
-            + str(row["lo"])
-            + ";"
-            + str(round(self.Instrument[symbol].fundingRate, 6))
-        )
-        with open(filename, "a") as f:
-            f.write(data + "\n")
+
+        return Storage.get(filename)
+
+    def save_kline_data(self: Markets, row: dict, symbol: tuple, timefr: int) -> None:
+        store = Function.kline_store(self, symbol=symbol, timefr=timefr)
+        store.append(row, funding=round(self.Instrument[symbol].fundingRate, 6))
 
     def noll(self: Markets, val: str, length: int) -> str:
         r = ""
@@ -284,11 +261,9 @@ class Function(WS, Variables):
                 refer = emi
                 if emi not in Bots.keys():
                     emi = ""
-                data = service.select_database(  # read_database
-                    "select EXECID from %s where EXECID='%s' and account=%s"
-                    % (var.database_table, row["execID"], self.user_id),
-                )
-                if not data:
+                if not service.execid_exists(
+                    row["execID"], account=self.user_id, market=self.name
+                ):
                     handle_trade_or_delivery(row, emi, refer, cl_id)
                 Function.orders_processing(self, row=row, info=info)
 
@@ -303,8 +278,7 @@ class Function(WS, Variables):
                     lastQty = row["lastQty"]
                 else:
                     lastQty = 0
-                qwr = SelectDatabase.QWR.format(DATABASE_TABLE=var.database_table)
-                unclosed_positions = service.select_database(qwr)
+                unclosed_positions = service.unclosed_positions()
                 for position in unclosed_positions:
                     symbol = (position["SYMBOL"], position["MARKET"])
                     if row["symbol"] == symbol and position["POS"] != 0:
@@ -320,19 +294,10 @@ class Function(WS, Variables):
                         handle_trade_or_delivery(row, position["EMI"], "", "Delivery")
                 diff = -(lastQty + pos)
                 if diff != 0:
-                    qwr = (
-                        "select sum(QTY) as sum from "
-                        + var.database_table
-                        + " where SYMBOL = '"  # d emi
-                        + row["symbol"][0]
-                        + "' and MARKET = '"
-                        + self.name
-                        + "' and ACCOUNT = "
-                        + str(self.user_id)
-                        + " and side <> 'Fund'"
-                        + ";"
+                    data = service.ledger_totals(
+                        account=self.user_id, market=self.name, symbol=row["symbol"][0]
                     )
-                    data = service.select_database(query=qwr)[0]
+                    data = {"sum": data[()]["position"] if data else None}
                     if data["sum"] != diff:
                         message = ErrorMessage.IMPOSSIBLE_DATABASE_POSITION.format(
                             SYMBOL=row["symbol"][0],
@@ -498,15 +463,8 @@ class Function(WS, Variables):
                 emi = service.set_emi(symbol=row["symbol"])
         else:  # Retrieved from /execution or /execution/tradeHistory. The order
             # was made outside Tmatic.
-            for emi, values in var.orders.items():
-                for clOrdID, value in values.items():
-                    if value["orderID"] == row["orderID"]:
-                        # emi and clOrdID were defined in var.orders
-                        break
-                else:
-                    continue
-                break
-            else:
+            emi, clOrdID = service.get_order_by_id(row.get("orderID"))
+            if emi is None:
                 """There is no order with this orderID in the var.orders. The
                 order was not sent via Tmatic. Possibly retrieved from
                 Trading history"""
@@ -528,7 +486,7 @@ class Function(WS, Variables):
                 var.queue_order.put(
                     {"action": "delete", "clOrdID": clOrdID, "market": self.name}
                 )
-                del var.orders[emi][clOrdID]
+                service.remove_order(emi=emi, clOrdID=clOrdID)
             else:
                 order_not_found(clOrdID=clOrdID)
         else:
@@ -551,18 +509,11 @@ class Function(WS, Variables):
                         var.orders[emi][clOrdID]["leavesQty"], precision
                     )
                     if var.orders[emi][clOrdID]["leavesQty"] == 0:
-                        del var.orders[emi][clOrdID]
+                        service.remove_order(emi=emi, clOrdID=clOrdID)
                         if emi in Bots.keys():
                             if Bots[emi].multitrade:
                                 if Bots[emi].state != "Disconnected":
-                                    t = threading.Thread(
-                                        target=service.call_bot_function,
-                                        args=(
-                                            robo.run_bot[emi],
-                                            emi,
-                                        ),
-                                    )
-                                    t.start()
+                                    submit_bot(bot_name=emi, queue=True)
                     var.queue_order.put(
                         {"action": "delete", "clOrdID": clOrdID, "market": self.name}
                     )
@@ -572,7 +523,9 @@ class Function(WS, Variables):
             elif row["execType"] == "Replaced":
                 order_message = "Order replaced " + row["symbol"][0]
                 if emi in var.orders and clOrdID in var.orders[emi]:
-                    var.orders[emi][clOrdID]["orderID"] = row["orderID"]
+                    service.update_order_id(
+                        emi=emi, clOrdID=clOrdID, orderID=row["orderID"]
+                    )
                     info_p = price
                     """
                     """
@@ -651,6 +604,7 @@ class Function(WS, Variables):
         if emi in var.orders and clOrdID in var.orders[emi]:
             var.queue_order.put({"action": "put", "order": var.orders[emi][clOrdID]})
             var.orders[emi].move_to_end(clOrdID)
+            service.reindex_order(emi=emi, clOrdID=clOrdID, move=True)
         disp.bot_orders_processing = True
 
     def trades_display(
@@ -773,12 +727,20 @@ class Function(WS, Variables):
                 number = number + "0"
         return number
 
-    def kline_update_market(self: Markets, utcnow: datetime) -> None:
+    def kline_update_market(
+        self: Markets, utcnow: datetime, timefrs: Union[set, None] = None
+    ) -> None:
         """
-        Processing timeframes.
+        Processing timeframes. If timefrs is given, only klines of these
+        timeframes are checked.
         """
         for symbol, kline in self.klines.items():
+            if timefrs is not None and timefrs.isdisjoint(kline):
+                continue
+            service.fold_kline_hi_lo(self, symbol=symbol)
             for timefr, values in kline.items():
+                if timefrs is not None and timefr not in timefrs:
+                    continue
                 timefr_minutes = var.timeframe_human_format[timefr]
                 if utcnow > values["time"] + timedelta(minutes=timefr_minutes):
                     instrument = self.Instrument[symbol]
@@ -847,10 +809,6 @@ class Function(WS, Variables):
         Refresh information on screen
         """
         # adaptive_screen(self)
-        if utc.hour != var.refresh_hour:
-            service.select_database("select count(*) cou from robots")
-            var.refresh_hour = utc.hour
-            var.logger.info("Emboldening SQLite")
         current_time = time.gmtime()
         if current_time.tm_sec != disp.last_gmtime_sec:
             # We are here once a second
@@ -1304,14 +1262,14 @@ class Function(WS, Variables):
 
         num = int(disp.num_book / 2)
         display_order_book_values(
-            val=instrument.bids,
+            val=instrument.bids.levels(),
             start=num,
             end=disp.num_book,
             direct=1,
             side="bids",
         )
         display_order_book_values(
-            val=instrument.asks,
+            val=instrument.asks.levels(),
             start=num - 1,
             end=-1,
             direct=-1,
@@ -1375,6 +1333,11 @@ class Function(WS, Variables):
         if disp.refresh_bot_info:
             current_bot_note_tab = disp.bot_note.tab(disp.bot_note.select(), "text")
 
+            # Bot run statistics
+
+            if disp.bot_name in Bots.keys():
+                bot_menu.update_bot_info(bot_name=disp.bot_name)
+
             # Bot positions table
 
             if current_bot_note_tab == "Positions":
@@ -1581,29 +1544,13 @@ class Function(WS, Variables):
         Returns the value of the position if it is closed
         """
         instrument = self.Instrument[symbol]
-        if pos > 0 and instrument.bids:
-            try:
-                close = instrument.bids[0][0]
-            except IndexError:
-                message = (
-                    ErrorMessage.EMPTY_ORDERBOOK_DATA.format(SIDE="bid", SYMBOL=symbol),
-                )
-                _put_message(
-                    market=self.name, message=message, warning="warning", logger=False
-                )
-                return 0
-        elif pos <= 0 and instrument.asks:
-            try:
-                close = instrument.asks[0][0]
-            except IndexError:
-                message = (
-                    ErrorMessage.EMPTY_ORDERBOOK_DATA.format(SIDE="ask", SYMBOL=symbol),
-                )
-                _put_message(
-                    market=self.name, message=message, warning="warning", logger=False
-                )
-                return 0
+        # best_price is 0 if the side is empty and, unlike the levels, is
+        # never seen half updated by the websocket thread.
+        if pos > 0:
+            close = instrument.bids.best_price
         else:
+            close = instrument.asks.best_price
+        if not close:
             return 0
         calc = Function.calculate(
             self,
@@ -1715,11 +1662,7 @@ class Function(WS, Variables):
         TreeTable.market.tree.update()
 
     def find_order(self: Markets, price: float, symbol: str) -> Union[float, str]:
-        qty = 0
-        for values in var.orders.values():
-            for value in values.values():
-                if value["price"] == price and value["symbol"] == symbol:
-                    qty += value["leavesQty"]
+        qty = service.level_qty(symbol=symbol, price=price)
         if not qty:
             qty = ""
 
@@ -2679,17 +2622,74 @@ def clear_tables():
     var.lock_display.release()
 
 
+class BotExecutor:
+    """
+    Runs run_bot() of the bots in a pool of var.bot_workers threads. Runs
+    of the same bot never overlap: a run requested while the previous one
+    is still in progress is either skipped and counted as an overrun, or
+    queued and made once the previous run has finished.
+    """
+
+    pool = None
+    running = set()
+    queued = set()
+    lock = threading.Lock()
+
+
 def run_bot_thread(bot_name):
-    service.call_bot_function(function=robo.run_bot[bot_name], bot_name=bot_name)
+    start = time.perf_counter()
+    try:
+        service.call_bot_function(function=robo.run_bot[bot_name], bot_name=bot_name)
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        # The bot may have been deleted while it was running.
+        exists = bot_name in Bots.keys()
+        with BotExecutor.lock:
+            if bot_name in BotExecutor.queued and exists:
+                BotExecutor.queued.discard(bot_name)
+                BotExecutor.pool.submit(run_bot_thread, bot_name)
+            else:
+                BotExecutor.queued.discard(bot_name)
+                BotExecutor.running.discard(bot_name)
+        if exists:
+            bot = Bots[bot_name]
+            bot.run_count += 1
+            bot.run_time = elapsed
+            if elapsed > bot.run_time_max:
+                bot.run_time_max = elapsed
+
+
+def submit_bot(bot_name: str, queue: bool = False) -> None:
+    """
+    Runs run_bot() of the bot in the pool.
+
+    Parameters
+    ----------
+    bot_name: str
+        Bot name.
+    queue: bool
+        If the previous run of the bot is still in progress, the new run is
+        made after it when True, otherwise it is skipped and counted in
+        bot.overruns.
+    """
+    with BotExecutor.lock:
+        if BotExecutor.pool is None:
+            BotExecutor.pool = ThreadPoolExecutor(
+                max_workers=var.bot_workers, thread_name_prefix="bot"
+            )
+        if bot_name in BotExecutor.running:
+            if queue:
+                BotExecutor.queued.add(bot_name)
+            else:
+                Bots[bot_name].overruns += 1
+            return
+        BotExecutor.running.add(bot_name)
+        BotExecutor.pool.submit(run_bot_thread, bot_name)
 
 
 def run_bots(bot_list: list) -> None:
     for bot_name in bot_list:
-        t = threading.Thread(
-            target=run_bot_thread,
-            args=(bot_name,),
-        )
-        t.start()
+        submit_bot(bot_name=bot_name)
 
 
 """def target_time(timeframe_sec):
@@ -2722,27 +2722,130 @@ def download_kline_data(
     return res
 
 
+class KlineSchedule:
+    """
+    Deadlines of kline updates. heap holds (timestamp, timefr) of the next
+    candle boundary of every timeframe in use. kline_update() sleeps until
+    the earliest deadline or until wake_kline_update() is called.
+
+    recheck holds the markets whose klines must be checked at the next
+    pass, with the set of timeframes or None for all of them: markets that
+    were not active at a boundary and markets whose klines have just been
+    loaded.
+    """
+
+    heap = list()
+    timeframes = set()
+    recheck = dict()
+    event = threading.Event()
+
+
+def wake_kline_update(market: str = "") -> None:
+    """
+    Makes kline_update() look for new timeframes or stop. If the market is
+    given, its klines are checked for an overdue candle as soon as the
+    market is active.
+    """
+    if market:
+        _add_due(KlineSchedule.recheck, market=market, timefrs=None)
+    KlineSchedule.event.set()
+
+
+def _add_due(due: dict, market: str, timefrs: Union[set, None]) -> None:
+    if timefrs is None or due.get(market, set()) is None:
+        due[market] = None
+    else:
+        due.setdefault(market, set()).update(timefrs)
+
+
+def _kline_timeframes() -> dict:
+    """
+    Returns timeframes in use with the markets that have them.
+    """
+    res = dict()
+    for market in var.market_list:
+        ws = Markets[market]
+        for kline in list(ws.klines.values()):
+            for timefr in list(kline.keys()):
+                if timefr not in res:
+                    res[timefr] = set()
+                res[timefr].add(market)
+
+    return res
+
+
+def _next_boundary(timefr: str, now: float) -> float:
+    seconds = var.timeframe_human_format[timefr] * 60
+
+    return (now // seconds + 1) * seconds
+
+
 def kline_update():
+    """
+    Closes klines at the candle boundaries. Only the markets that have
+    klines of the timeframes that are due are processed.
+    """
     while var.kline_update_active:
+        KlineSchedule.event.clear()
+        in_use = _kline_timeframes()
+        now = time.time()
+        for timefr in in_use.keys() - KlineSchedule.timeframes:
+            # A new timeframe is checked at once, a boundary may have passed
+            # while its klines were being loaded.
+            heapq.heappush(KlineSchedule.heap, (now, timefr))
+            KlineSchedule.timeframes.add(timefr)
+        due = dict()
+        for market in list(KlineSchedule.recheck):
+            if Markets[market].api_is_active:
+                _add_due(due, market=market, timefrs=KlineSchedule.recheck.pop(market))
+        while KlineSchedule.heap and KlineSchedule.heap[0][0] <= now:
+            _, timefr = heapq.heappop(KlineSchedule.heap)
+            if timefr in in_use:
+                heapq.heappush(
+                    KlineSchedule.heap, (_next_boundary(timefr, now), timefr)
+                )
+                for market in in_use[timefr]:
+                    _add_due(due, market=market, timefrs={timefr})
+            else:
+                KlineSchedule.timeframes.discard(timefr)
+        if not due:
+            if KlineSchedule.heap:
+                KlineSchedule.event.wait(KlineSchedule.heap[0][0] - now)
+            else:
+                KlineSchedule.event.wait()
+            continue
         utcnow = datetime.now(tz=timezone.utc)
         var.lock_kline_update.acquire(True)
         threads = []
-        for market in var.market_list:
+        for market, timefrs in due.items():
             ws = Markets[market]
             if ws.api_is_active:
                 t = threading.Thread(
                     target=Function.kline_update_market,
-                    args=(
-                        ws,
-                        utcnow,
-                    ),
+                    args=(ws, utcnow, timefrs),
                 )
                 threads.append(t)
                 t.start()
+            else:
+                # The overdue klines are closed when the market is active.
+                _add_due(KlineSchedule.recheck, market=market, timefrs=timefrs)
         [thread.join() for thread in threads]
         var.lock_kline_update.release()
-        rest = 1 - time.time() % 1
-        time.sleep(rest)
+
+
+def indicator_update():
+    """
+    Applies the prices published by the websocket threads to the
+    indicators. Wakes up when the websocket threads publish new prices of
+    the symbols used by indicators. The websocket threads do not wait for
+    the indicators, the prices of a burst of order book messages are
+    applied in their order at the next wake-up.
+    """
+    while var.indicator_update_active:
+        service.TopOfBook.event.wait()
+        service.TopOfBook.event.clear()
+        for symbol in list(BreakDown.symbols):
+            service.apply_prices(symbol=symbol)
 
 
 def merge_klines(data: list, timefr_minutes: int, prev: int):
@@ -2803,91 +2906,176 @@ def merge_klines(data: list, timefr_minutes: int, prev: int):
     return res
 
 
+def base_timeframe(self: Markets, timefrs: list) -> int:
+    """
+    Returns the largest exchange time interval in minutes from which all
+    the given timeframes can be built.
+    """
+    common = 0
+    for timefr in timefrs:
+        common = math.gcd(common, var.timeframe_human_format[timefr])
+    for tf_min in reversed(self.timefrs.keys()):
+        if common % tf_min == 0:
+            return tf_min
+
+    return 1
+
+
+def group_timeframes(self: Markets, timefrs: list) -> list:
+    """
+    Splits the timeframes into groups that are built from one downloaded
+    base series each. A timeframe joins a group only if the shared series
+    has no more rows than the group and the timeframe downloaded
+    separately, e.g. 1m and 1h are downloaded separately, because 150
+    hours of 1m klines are much more than 150 klines of 1m and 1h.
+    """
+
+    def rows(group: list) -> int:
+        minutes = max(var.timeframe_human_format[timefr] for timefr in group)
+
+        return robo.CANDLESTICK_NUMBER * minutes // base_timeframe(self, group)
+
+    groups = list()
+    for timefr in sorted(timefrs, key=lambda x: var.timeframe_human_format[x]):
+        for group in groups:
+            if rows(group + [timefr]) <= rows(group) + rows([timefr]):
+                group.append(timefr)
+                break
+        else:
+            groups.append([timefr])
+
+    return groups
+
+
 def load_klines(
     self: Markets,
     symbol: tuple,
-    timefr: str,
+    timefrs: list,
+    klines: dict,
+) -> Union[dict, None]:
+    """
+    Loading kline data from the exchange server. Timeframes of the symbol
+    that can be built from one base series within the same number of
+    rows, see group_timeframes(), share a series, which is downloaded once
+    with the largest exchange time interval suitable for all of them.
+
+    Closed klines are recorded in a binary file for each timeframe. The
+    file is kept between reboots, so after a reboot only the klines that
+    are missing since the last stored one are downloaded.
+    """
+    for group in group_timeframes(self, timefrs=timefrs):
+        if not load_kline_series(self, symbol=symbol, timefrs=group, klines=klines):
+            return None
+    # The current kline is overdue if a boundary passed during the download.
+    wake_kline_update(market=self.name)
+
+    return klines
+
+
+def load_kline_series(
+    self: Markets,
+    symbol: tuple,
+    timefrs: list,
     klines: dict,
 ) -> Union[dict, None]:
     """
-    Loading kline data from the exchange server. Data is recorded
-    in files for each timeframe. Every time you reboot the files are
-    overwritten.
+    Downloads one base series and builds the given timeframes from it.
     """
-    filename = Function.kline_data_filename(self, symbol=symbol, timefr=timefr)
-    with open(filename, "w") as f:
-        f.write("date;time;open_bid;open_ask;hi;lo;fund" + "\n")
     target = datetime.now(tz=timezone.utc)
     target = target.replace(second=0, microsecond=0)
-    timefr_minutes = var.timeframe_human_format[timefr]
-    original = timefr_minutes
-    prev = 1
-    for tf_min in reversed(self.timefrs.keys()):
-        if tf_min == timefr_minutes:
-            prev = tf_min
-            break
-        elif tf_min < timefr_minutes:
-            if timefr_minutes % tf_min == 0:
-                prev = tf_min
-                break
-    factor = int(timefr_minutes / prev)
-    timefr_minutes = prev
-    start_time = target - timedelta(
-        minutes=robo.CANDLESTICK_NUMBER * timefr_minutes * factor - timefr_minutes
-    )
-    delta = timedelta(
-        minutes=target.minute % timefr_minutes + (target.hour * 60) % timefr_minutes
-    )
+    base = base_timeframe(self, timefrs=timefrs)
+    delta = timedelta(minutes=target.minute % base + (target.hour * 60) % base)
+    series = dict()
+    for timefr in timefrs:
+        store = Function.kline_store(self, symbol=symbol, timefr=timefr)
+        timefr_minutes = var.timeframe_human_format[timefr]
+        start_time = target - timedelta(
+            minutes=robo.CANDLESTICK_NUMBER * timefr_minutes - base
+        )
+
+        # If the file already contains klines for the requested period, only
+        # the missing tail is downloaded. The last stored kline is requested
+        # again, so that the download always starts at the beginning of a
+        # period and overlaps the stored history.
+
+        last_time = store.last_time()
+        history = []
+        if last_time and last_time >= start_time:
+            history = [
+                row
+                for row in store.rows(start=-robo.CANDLESTICK_NUMBER)
+                if row["datetime"] >= start_time
+            ]
+            download_from = last_time
+        else:
+            download_from = start_time
+        series[timefr] = {
+            "store": store,
+            "last_time": last_time,
+            "history": history,
+            "download_from": download_from,
+        }
     target -= delta
 
-    # Loading timeframe data
+    # Loading base timeframe data
 
     res = download_kline_data(
         self,
-        start_time=start_time,
+        start_time=min(value["download_from"] for value in series.values()),
         target=target,
         symbol=symbol,
-        timeframe=timefr_minutes,
+        timeframe=base,
     )
     if not res:
-        message = str(symbol) + " " + str(timefr) + " kline data was not loaded!"
+        message = str(symbol) + " " + str(timefrs) + " kline data was not loaded!"
         var.logger.error(message)
         return None
 
     # Bitmex bug fix. Bitmex can send data with the next period's
     # timestamp typically for 5m and 60m.
     if target < res[-1]["timestamp"]:
-        delta = timedelta(minutes=timefr_minutes)
+        delta = timedelta(minutes=base)
         for r in res:
             r["timestamp"] -= delta
-
-    # The 'klines' array is filled with timeframe data.
     if res[0]["timestamp"] > res[-1]["timestamp"]:
         res.reverse()
-    if factor > 1:
-        res = merge_klines(data=res, timefr_minutes=original, prev=prev)
-    klines[symbol][timefr]["data"] = []
-    for num, row in enumerate(res):
-        tm = row["timestamp"]  # - timedelta(minutes=timefr_minutes)
-        klines[symbol][timefr]["data"].append(
-            {
-                "date": (tm.year - 2000) * 10000 + tm.month * 100 + tm.day,
-                "time": tm.hour * 100 + tm.minute,
-                "open_bid": float(row["open"]),
-                "open_ask": float(row["open"]),
-                "hi": float(row["high"]),
-                "lo": float(row["low"]),
-                "datetime": tm,
-            }
-        )
-        if num < len(res) - 1:
-            Function.save_kline_data(
-                self,
-                row=klines[symbol][timefr]["data"][-1],
-                symbol=symbol,
-                timefr=timefr,
+
+    # The 'klines' array is filled with timeframe data.
+
+    for timefr, value in series.items():
+        timefr_minutes = var.timeframe_human_format[timefr]
+        data = [row for row in res if row["timestamp"] >= value["download_from"]]
+        if timefr_minutes > base:
+            data = merge_klines(data=data, timefr_minutes=timefr_minutes, prev=base)
+        last_time = value["last_time"]
+        klines[symbol][timefr]["data"] = value["history"]
+        for row in data:
+            tm = row["timestamp"]
+            if last_time and tm <= last_time:
+                continue
+            klines[symbol][timefr]["data"].append(
+                {
+                    "date": (tm.year - 2000) * 10000 + tm.month * 100 + tm.day,
+                    "time": tm.hour * 100 + tm.minute,
+                    "open_bid": float(row["open"]),
+                    "open_ask": float(row["open"]),
+                    "hi": float(row["high"]),
+                    "lo": float(row["low"]),
+                    "datetime": tm,
+                }
             )
-    klines[symbol][timefr]["time"] = tm
+        if not klines[symbol][timefr]["data"]:
+            message = str(symbol) + " " + str(timefr) + " kline data was not loaded!"
+            var.logger.error(message)
+            return None
+        klines[symbol][timefr]["time"] = klines[symbol][timefr]["data"][-1]["datetime"]
+
+        # The last kline is not closed yet and will be saved by
+        # kline_update_market() when its period ends.
+        closed = klines[symbol][timefr]["data"][len(value["history"]) : -1]
+        value["store"].append(
+            closed, funding=round(self.Instrument[symbol].fundingRate, 6)
+        )
 
     return klines
 
@@ -2920,6 +3108,7 @@ def add_new_kline(self: Markets, symbol: tuple, bot_name: str, timefr: str) -> N
         except KeyError:
             self.klines[symbol] = dict()
             append_new()
+        wake_kline_update()
 
 
 def init_market_klines(
@@ -2931,12 +3120,12 @@ def init_market_klines(
 
     success = []
 
-    def get_in_thread(symbol: tuple, timefr: str, klines: dict, number: int):
+    def get_in_thread(symbol: tuple, timefrs: list, klines: dict, number: int):
         nonlocal success
         res = load_klines(
             self,
             symbol=symbol,
-            timefr=timefr,
+            timefrs=timefrs,
             klines=klines,
         )
         if not res:
@@ -2947,15 +3136,14 @@ def init_market_klines(
     threads = []
 
     for symbol, timeframes in self.klines.items():
-        for timefr in timeframes.keys():
-            success.append(None)
-            t = threading.Thread(
-                target=get_in_thread,
-                args=(symbol, timefr, self.klines, len(success) - 1),
-            )
+        success.append(None)
+        t = threading.Thread(
+            target=get_in_thread,
+            args=(symbol, list(timeframes.keys()), self.klines, len(success) - 1),
+        )
 
-            threads.append(t)
-            t.start()
+        threads.append(t)
+        t.start()
     [thread.join() for thread in threads]
     for s in success:
         if not s:
@@ -2972,13 +3160,13 @@ def init_bot_klines(bot_name: str) -> None:
     success = []
 
     def get_in_thread(
-        ws: Markets, symbol: tuple, timefr: str, klines: dict, number: int
+        ws: Markets, symbol: tuple, timefrs: list, klines: dict, number: int
     ):
         nonlocal success
         res = load_klines(
             ws,
             symbol=symbol,
-            timefr=timefr,
+            timefrs=timefrs,
             klines=klines,
         )
         if not res:
@@ -2989,16 +3177,19 @@ def init_bot_klines(bot_name: str) -> None:
     for market in var.market_list:
         ws = Markets[market]
         for symbol, timeframes in ws.klines.items():
+            timefrs = list()
             for timefr, value in timeframes.items():
                 if bot_name in value["robots"]:
                     if not value["data"]:
-                        itm = {
-                            "symbol": symbol,
-                            "bot_name": bot_name,
-                            "timefr": timefr,
-                            "market": market,
-                        }
-                        kline_to_download.append(itm)
+                        timefrs.append(timefr)
+            if timefrs:
+                itm = {
+                    "symbol": symbol,
+                    "bot_name": bot_name,
+                    "timefrs": timefrs,
+                    "market": market,
+                }
+                kline_to_download.append(itm)
         """for item in ws.klin_set:
             if item[1] == bot_name:
                 symbol = (item[0], market)
@@ -3018,7 +3209,7 @@ def init_bot_klines(bot_name: str) -> None:
             ws = Markets[kline["market"]]
             t = threading.Thread(
                 target=get_in_thread,
-                args=(ws, kline["symbol"], kline["timefr"], ws.klines, num),
+                args=(ws, kline["symbol"], kline["timefrs"], ws.klines, num),
             )
             threads.append(t)
             t.start()
@@ -3030,9 +3221,9 @@ def init_bot_klines(bot_name: str) -> None:
                 message = (
                     kline_to_download[num]["market"]
                     + " "
-                    + kline_to_download[num]["symbol"]
+                    + str(kline_to_download[num]["symbol"])
                     + " "
-                    + kline_to_download[num]["timefr"]
+                    + str(kline_to_download[num]["timefrs"])
                     + " kline is not loaded."
                 )
                 var.logger.error(message)
@@ -3119,6 +3310,7 @@ def clear_klines():
     """
     for market in var.market_list:
         Markets[market].klines = dict()
+        service.clear_hi_lo(market)
 
 
 def update_instruments():
@@ -31,6 +31,27 @@ class BreakDown:
         self.parameters["number"] = 0
         self.parameters["trades"] = 0
 
+    @staticmethod
+    def update(symbol: tuple, ask: float, bid: float) -> None:
+        """
+        Counts the breaks of the up and dn levels by the best ask and bid
+        of one order book update. Updates must be passed in the order they
+        were received.
+        """
+        for timeframes in list(BreakDown.symbols.get(symbol, {}).values()):
+            for parameters in list(timeframes.values()):
+                direct = parameters["first"] * (parameters["number"] % 2 * 2 - 1)
+                if parameters["up"]:
+                    if direct >= 0 and ask > parameters["up"]:
+                        parameters["number"] += 1
+                        if parameters["first"] == 0:
+                            parameters["first"] = -1
+                if parameters["dn"]:
+                    if direct <= 0 and bid < parameters["dn"]:
+                        parameters["number"] += 1
+                        if parameters["first"] == 0:
+                            parameters["first"] = 1
+
 
 def clean_indicators(bot_name: str, timefr="") -> None:
     for symbol in BreakDown.symbols.copy():
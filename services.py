@@ -1,15 +1,21 @@
+import heapq
 import os
 import platform
+import queue
+import sqlite3
+import threading
 import time
 import tkinter as tk
 import traceback
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
+from pathlib import Path
 from typing import Callable, Union
 
 from dotenv import dotenv_values, set_key
 
 from common.data import BotData, Bots, Instrument
+from common.orderbook import BookSide
 from common.variables import Variables as var
 from display.messages import ErrorMessage, Message
 from indicators import BreakDown
@@ -217,6 +223,7 @@ def add_space(line: list) -> str:
 
 
 def close(markets):
+    flush_database(timeout=10)
     for bot_name in var.bot_thread_active:
         var.bot_thread_active[bot_name] = False
     for name in var.market_list:
@@ -237,23 +244,119 @@ def display_exception(exception, display=True) -> str:
     return formated
 
 
-def select_database(query: str) -> list:
+def set_pragmas(connection: sqlite3.Connection, read_only=False) -> None:
+    """
+    Applies var.database_pragmas to the connection. With the WAL journal
+    mode readers and the writer do not block each other.
+    """
+    for pragma, value in var.database_pragmas.items():
+        if read_only and pragma == "journal_mode":
+            continue
+        connection.execute("PRAGMA " + pragma + " = " + str(value))
+
+
+class ReadPool:
+    """
+    Separate read-only connections for select_database(), so that reads do
+    not wait for var.sql_lock held by the writers. If all connections are
+    in use for var.database_read_wait seconds, e.g. by a query run while
+    iterating over iter_database(), the writer connection is used.
+    """
+
+    connections = queue.Queue()
+    created = 0
+    lock = threading.Lock()
+
+
+def _get_read_connection() -> Union[sqlite3.Connection, None]:
+    try:
+        return ReadPool.connections.get_nowait()
+    except queue.Empty:
+        pass
+    with ReadPool.lock:
+        if ReadPool.created < var.database_read_connections:
+            ReadPool.created += 1
+            try:
+                connection = sqlite3.connect(
+                    Path(var.db_sqlite).resolve().as_uri() + "?mode=ro",
+                    uri=True,
+                    check_same_thread=False,
+                    cached_statements=var.database_statement_cache,
+                )
+                set_pragmas(connection, read_only=True)
+
+                return connection
+            except Exception as e:
+                ReadPool.created -= 1
+                var.logger.error("Sqlite Error: read connection: " + str(e))
+
+                return None
+
+    try:
+        return ReadPool.connections.get(timeout=var.database_read_wait)
+    except queue.Empty:
+        return None
+
+
+def _set_row_factory(cursor: sqlite3.Cursor, row: str) -> None:
+    if row == "row":
+        cursor.row_factory = sqlite3.Row
+    else:
+        cursor.row_factory = None
+
+
+def _make_rows(cursor: sqlite3.Cursor, rows: list, row: str) -> list:
+    if row == "dict" and rows:
+        keys = [column[0] for column in cursor.description]
+        return [dict(zip(keys, values)) for values in rows]
+
+    return rows
+
+
+def select_database(query: str, params: Union[tuple, dict] = (), row="dict") -> list:
+    """
+    Runs a select query and returns all rows.
+
+    Parameters
+    ----------
+    query: str
+        SQL with ``?`` or ``:name`` placeholders. The text of the query
+        should not change from call to call, so that the prepared
+        statement is taken from the statement cache of the connection.
+    params: tuple | dict
+        Values bound to the placeholders.
+    row: str
+        "dict" returns dictionaries, "tuple" plain tuples and "row"
+        sqlite3.Row objects.
+
+    Returns
+    -------
+    list
+        Rows of the result, or None if the query failed.
+    """
+    flush_database()
     err_locked = 0
     while True:
+        connection = _get_read_connection()
         try:
-            var.sql_lock.acquire(True)
-            var.cursor_sqlite.execute(query)
-            orig = var.cursor_sqlite.fetchall()
-            var.sql_lock.release()
-            data = []
-            if orig:
-                data = list(map(lambda x: dict(zip(orig[0].keys(), x)), orig))
-            return data
+            if connection is None:
+                var.sql_lock.acquire(True)
+                try:
+                    cursor = var.connect_sqlite.cursor()
+                    _set_row_factory(cursor, row)
+                    orig = cursor.execute(query, params).fetchall()
+                finally:
+                    var.sql_lock.release()
+            else:
+                cursor = connection.cursor()
+                _set_row_factory(cursor, row)
+                orig = cursor.execute(query, params).fetchall()
+
+            return _make_rows(cursor, orig, row)
         except Exception as e:  # var.error_sqlite
             if "database is locked" not in str(e):
                 print("_____query:", query)
                 var.logger.error("Sqlite Error: " + str(e) + ")")
-                var.sql_lock.release()
                 break
             else:
                 err_locked += 1
@@ -262,25 +365,428 @@ def select_database(query: str) -> list:
                     + str(err_locked)
                     + ")"
                 )
-                var.sql_lock.release()
+        finally:
+            if connection is not None:
+                ReadPool.connections.put(connection)
 
 
-def insert_database(values: list, table: str) -> None:
+def iter_database(
+    query: str, params: Union[tuple, dict] = (), row="tuple", size: int = 1000
+):
+    """
+    Same as select_database(), but yields rows lazily, fetching ``size``
+    rows at a time, so that large results are not held in memory. The read
+    connection is returned to the pool when the iteration ends or the
+    generator is closed.
+    """
+    flush_database()
+    connection = _get_read_connection()
+    if connection is None:
+        yield from select_database(query, params=params, row=row) or []
+        return
+    try:
+        cursor = connection.cursor()
+        _set_row_factory(cursor, row)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            yield from _make_rows(cursor, rows, row)
+    except Exception as e:  # var.error_sqlite
+        var.logger.error("Sqlite Error: " + str(e) + " for: " + query)
+    finally:
+        ReadPool.connections.put(connection)
+
+
+class DatabaseWriter:
+    """
+    Inserts rows into the trade table from a separate thread. Rows are taken
+    from var.queue_database and written with executemany() in one
+    transaction per batch. A batch is committed when it reaches
+    var.database_batch_size rows, var.database_flush_interval seconds after
+    its first row, or when flush_database() is called.
+    """
+
+    thread = None
+    lock = threading.Lock()
+    pending = 0
+
+
+def _insert_trades(batch: list) -> None:
+    query = (
+        "insert into "
+        + var.database_table
+        + " (EXECID,EMI,REFER,CURRENCY,SYMBOL,"
+        + "TICKER,CATEGORY,MARKET,SIDE,QTY,QTY_REST,PRICE,"
+        + "THEOR_PRICE,TRADE_PRICE,SUMREAL,COMMISS,CLORDID,TTIME,"
+        + "ACCOUNT) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+    )
     err_locked = 0
     while True:
         try:
             var.sql_lock.acquire(True)
-            if table == var.database_table:
-                var.cursor_sqlite.execute(
-                    "insert into "
-                    + var.database_table
-                    + " (EXECID,EMI,REFER,CURRENCY,SYMBOL,"
-                    + "TICKER,CATEGORY,MARKET,SIDE,QTY,QTY_REST,PRICE,"
-                    + "THEOR_PRICE,TRADE_PRICE,SUMREAL,COMMISS,CLORDID,TTIME,"
-                    + "ACCOUNT) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
-                    values,
+            var.connect_sqlite.executemany(query, batch)
+            var.connect_sqlite.commit()
+            var.sql_lock.release()
+            return
+        except Exception as ex:  # var.error_sqlite
+            var.connect_sqlite.rollback()
+            var.sql_lock.release()
+            if "database is locked" not in str(ex):
+                if len(batch) > 1:
+                    # The rows are inserted one at a time, so that only the
+                    # rows that really fail are lost.
+                    for row in batch:
+                        _insert_trades([row])
+                else:
+                    var.logger.error(f"Sqlite Error: {str(ex)} for: {batch[0][0]}")
+                return
+            else:
+                err_locked += 1
+                var.logger.error(
+                    "Sqlite Error: Database is locked (attempt: "
+                    + str(err_locked)
+                    + ")"
                 )
-            elif table == "robots":
+
+
+def _database_writer() -> None:
+    while True:
+        item = var.queue_database.get()
+        batch, events = list(), list()
+        deadline = time.time() + var.database_flush_interval
+        while True:
+            if isinstance(item, threading.Event):
+                events.append(item)
+            else:
+                batch.append(item)
+            if len(batch) >= var.database_batch_size:
+                break
+            try:
+                if events:
+                    item = var.queue_database.get_nowait()
+                else:
+                    item = var.queue_database.get(timeout=deadline - time.time())
+            except (queue.Empty, ValueError):
+                break
+        if batch:
+            _insert_trades(batch)
+            with DatabaseWriter.lock:
+                DatabaseWriter.pending -= len(batch)
+        for event in events:
+            event.set()
+
+
+def flush_database(timeout: Union[float, None] = None) -> bool:
+    """
+    Waits until all rows queued for the trade table are committed. Must not
+    be called while holding var.sql_lock.
+
+    Returns
+    -------
+    bool
+        False if the timeout expired.
+    """
+    if not DatabaseWriter.pending or DatabaseWriter.thread is None:
+        return True
+    if threading.current_thread() is DatabaseWriter.thread:
+        return False
+    event = threading.Event()
+    var.queue_database.put(event)
+
+    return event.wait(timeout)
+
+
+class ExecIDs:
+    """
+    The execIDs recorded in the trade table, kept in memory as a set of
+    (execID, account, market) so that incoming executions can be checked
+    for duplicates without querying the database. The set is loaded from
+    the <table>_all view, which includes the archived trades, on first use
+    and updated with every queued trade row.
+    """
+
+    table = ""
+    ids = set()
+    lock = threading.Lock()
+
+
+def _execid_key(execID, account, market: str) -> tuple:
+    return (str(execID), str(account), market)
+
+
+def _load_execids() -> None:
+    flush_database()
+    var.sql_lock.acquire(True)
+    try:
+        rows = var.connect_sqlite.execute(
+            "select EXECID, ACCOUNT, MARKET from " + var.database_table + "_all"
+        ).fetchall()
+    finally:
+        var.sql_lock.release()
+    ExecIDs.ids = set(_execid_key(row[0], row[1], row[2]) for row in rows)
+    ExecIDs.table = var.database_table
+
+
+def execid_exists(execID: str, account: Union[int, str], market: str) -> bool:
+    """
+    Checks if the execution is already recorded in the trade table.
+    """
+    with ExecIDs.lock:
+        if ExecIDs.table != var.database_table:
+            _load_execids()
+
+        return _execid_key(execID, account, market) in ExecIDs.ids
+
+
+def new_executions(rows: list, account: Union[int, str], market: str) -> list:
+    """
+    Returns the rows whose execID is not yet recorded in the trade table.
+    A row repeated within ``rows`` is returned once.
+    """
+    res = list()
+    with ExecIDs.lock:
+        if ExecIDs.table != var.database_table:
+            _load_execids()
+        seen = set()
+        for row in rows:
+            key = _execid_key(row["execID"], account, market)
+            if key not in ExecIDs.ids and key not in seen:
+                seen.add(key)
+                res.append(row)
+
+    return res
+
+
+class Ledger:
+    """
+    Totals of the trade table by (account, market, emi, symbol): position,
+    volume, sumreal and commission of trades and deliveries, funding and the
+    time of the last row. The ledger is read from the trigger maintained
+    <table>_summary table on first use and then updated with every queued
+    trade row. It is read again after update_database() changes the trade
+    table.
+    """
+
+    table = ""
+    entries = dict()
+    lock = threading.Lock()
+    fields = ("position", "volume", "sumreal", "commiss", "funding")
+
+
+def _ledger_key(account, market: str, emi: str, symbol: str) -> tuple:
+    return (str(account), market, emi, symbol)
+
+
+def _load_ledger() -> None:
+    Ledger.table = ""
+    data = select_database("select * from " + var.database_table + "_summary;")
+    if not isinstance(data, list):
+        return
+    entries = dict()
+    for row in data:
+        key = _ledger_key(row["ACCOUNT"], row["MARKET"], row["EMI"], row["SYMBOL"])
+        entries[key] = {
+            "position": row["POS"] or 0,
+            "volume": row["VOL"] or 0,
+            "sumreal": row["SUMREAL"] or 0,
+            "commiss": row["COMMISS"] or 0,
+            "funding": row["FUNDING"] or 0,
+            "ltime": str(row["LTIME"]) if row["LTIME"] else None,
+            "ticker": row["TICKER"],
+            "category": row["CATEGORY"],
+            "currency": row["CURRENCY"],
+        }
+    Ledger.entries = entries
+    Ledger.table = var.database_table
+
+
+def rebuild_summary(table: str) -> Union[str, None]:
+    """
+    Refills the <table>_summary table from the trade table. The summary is
+    kept up to date by triggers, this is only needed when it is created or
+    found inconsistent, see create_summary_for_trades() in common/init.py.
+
+    Returns
+    -------
+    str | None
+        Description of the error, or None if successful.
+    """
+    flush_database()
+    summary = table + "_summary"
+    try:
+        with var.sql_lock:
+            var.cursor_sqlite.execute("delete from " + summary + ";")
+            var.cursor_sqlite.execute(
+                "insert into "
+                + summary
+                + " (ACCOUNT, MARKET, EMI, SYMBOL, TICKER, CATEGORY, CURRENCY, "
+                + "CNT, POS, VOL, SUMREAL, COMMISS, FUNDING, LTIME) "
+                + "select ACCOUNT, MARKET, EMI, SYMBOL, max(TICKER), "
+                + "max(CATEGORY), max(CURRENCY), count(*), "
+                + "ifnull(sum(case when SIDE <> 'Fund' then QTY else 0 end), 0), "
+                + "ifnull(sum(case when SIDE = 'Fund' then 0 when SIDE = 'Bal' "
+                + "then QTY_REST else abs(QTY) end), 0), "
+                + "ifnull(sum(case when SIDE <> 'Fund' then SUMREAL else 0 end), 0), "
+                + "ifnull(sum(case when SIDE <> 'Fund' then COMMISS else 0 end), 0), "
+                + "ifnull(sum(case when SIDE = 'Fund' then COMMISS else 0 end), 0), "
+                + "max(TTIME) from "
+                + table
+                + " group by ACCOUNT, MARKET, EMI, SYMBOL;"
+            )
+            var.connect_sqlite.commit()
+    except Exception as ex:
+        var.connect_sqlite.rollback()
+        err_str = f"Sqlite Error: {str(ex)} for: {summary}"
+        var.logger.error(err_str)
+        return err_str
+    if table == var.database_table:
+        with Ledger.lock:
+            Ledger.table = ""
+
+
+def _ledger_add(values: list) -> None:
+    """
+    Adds a trade table row in the insert_database() format to the ledger.
+    """
+    key = _ledger_key(values[18], values[7], values[1], values[4])
+    if key not in Ledger.entries:
+        Ledger.entries[key] = {
+            "position": 0,
+            "volume": 0,
+            "sumreal": 0,
+            "commiss": 0,
+            "funding": 0,
+            "ltime": None,
+            "ticker": values[5],
+            "category": values[6],
+            "currency": values[3],
+        }
+    entry = Ledger.entries[key]
+    if values[8] == "Fund":
+        entry["funding"] += values[15]
+    else:
+        entry["position"] += values[9]
+        entry["volume"] += abs(values[9])
+        entry["sumreal"] += values[14]
+        entry["commiss"] += values[15]
+    ttime = str(values[17])
+    if entry["ltime"] is None or ttime > entry["ltime"]:
+        entry["ltime"] = ttime
+
+
+def ledger_totals(
+    group: tuple = (),
+    account: Union[int, str, None] = None,
+    market: Union[str, None] = None,
+    emi: Union[str, None] = None,
+    symbol: Union[str, None] = None,
+) -> dict:
+    """
+    Sums up the ledger entries that match the given filters.
+
+    Parameters
+    ----------
+    group: tuple
+        Names from "account", "market", "emi", "symbol" to group by.
+    account, market, emi, symbol:
+        Filters. None means any value.
+
+    Returns
+    -------
+    dict
+        The key is a tuple of the grouped values, the value is a dictionary
+        with "position", "volume", "sumreal", "commiss", "funding", "ltime",
+        "ticker", "category", "currency".
+    """
+    names = ("account", "market", "emi", "symbol")
+    filters = (
+        None if account is None else str(account),
+        market,
+        emi,
+        symbol,
+    )
+    res = dict()
+    with Ledger.lock:
+        if Ledger.table != var.database_table:
+            _load_ledger()
+        for key, entry in Ledger.entries.items():
+            if any(f is not None and f != k for f, k in zip(filters, key)):
+                continue
+            res_key = tuple(key[names.index(name)] for name in group)
+            if res_key not in res:
+                res[res_key] = dict(entry)
+            else:
+                total = res[res_key]
+                for field in Ledger.fields:
+                    total[field] += entry[field]
+                if entry["ltime"] and (
+                    total["ltime"] is None or entry["ltime"] > total["ltime"]
+                ):
+                    total["ltime"] = entry["ltime"]
+
+    return res
+
+
+def unclosed_positions() -> list:
+    """
+    Positions that are not closed, summed up by emi, market and symbol, in
+    the same format as the rows of the trade table.
+    """
+    data = list()
+    for (emi, market, symbol), total in ledger_totals(
+        group=("emi", "market", "symbol")
+    ).items():
+        if total["position"] != 0:
+            data.append(
+                {
+                    "SYMBOL": symbol,
+                    "TICKER": total["ticker"],
+                    "CATEGORY": total["category"],
+                    "EMI": emi,
+                    "POS": total["position"],
+                    "PNL": total["sumreal"],
+                    "MARKET": market,
+                    "TTIME": total["ltime"],
+                }
+            )
+    data.sort(key=lambda x: x["SYMBOL"], reverse=True)
+
+    return data
+
+
+def _queue_trade(values: list) -> None:
+    with DatabaseWriter.lock:
+        if DatabaseWriter.thread is None:
+            DatabaseWriter.thread = threading.Thread(
+                target=_database_writer, daemon=True
+            )
+            DatabaseWriter.thread.start()
+        DatabaseWriter.pending += 1
+    with Ledger.lock:
+        if Ledger.table == var.database_table:
+            _ledger_add(values)
+        var.queue_database.put(list(values))
+    with ExecIDs.lock:
+        if ExecIDs.table == var.database_table:
+            ExecIDs.ids.add(_execid_key(values[0], values[18], values[7]))
+
+
+def insert_database(values: list, table: str) -> None:
+    """
+    Inserts a row into the table. Rows of the trade table are queued and
+    written in batches by DatabaseWriter, use flush_database() to wait for
+    them.
+    """
+    if table == var.database_table:
+        _queue_trade(values)
+        return None
+    err_locked = 0
+    while True:
+        try:
+            var.sql_lock.acquire(True)
+            if table == "robots":
                 var.cursor_sqlite.execute(
                     "insert into robots (EMI,STATE,TIMEFR) VALUES (?,?,?)",
                     values,
@@ -317,14 +823,27 @@ def insert_database(values: list, table: str) -> None:
                 var.sql_lock.release()
 
 
-def update_database(query: list) -> Union[str, None]:
+def update_database(query: str, params: Union[tuple, dict] = ()) -> Union[str, None]:
+    """
+    Runs a query that changes the database, ``params`` are bound to the
+    placeholders of the query.
+
+    Returns
+    -------
+    str | None
+        Description of the error, or None if successful.
+    """
+    flush_database()
     err_locked = 0
     while True:
         try:
             var.sql_lock.acquire(True)
-            var.cursor_sqlite.execute(query)
+            var.cursor_sqlite.execute(query, params)
             var.connect_sqlite.commit()
             var.sql_lock.release()
+            if var.database_table and var.database_table in query:
+                with Ledger.lock:
+                    Ledger.table = ""
             return None
         except Exception as e:  # var.error_sqlite
             if "database is locked" not in str(e):
@@ -369,6 +888,190 @@ def fill_order(emi: str, clOrdID: str, category: str, value: dict) -> None:
         var.orders[emi][clOrdID]["orderID"] = value["orderID"]
         var.orders[emi][clOrdID]["clOrdID"] = clOrdID
         var.orders[emi][clOrdID]["orderQty"] = value["orderQty"]
+        OrderIndex.emi[clOrdID] = emi
+        OrderIndex.clOrdID[value["orderID"]] = clOrdID
+        reindex_order(emi=emi, clOrdID=clOrdID)
+
+
+class OrderIndex:
+    """
+    Index of var.orders by clOrdID and by orderID, so that the order of an
+    incoming message is found without looking through the orders of every
+    bot. It is updated by fill_order(), update_order_id() and
+    remove_order(). Lookups check the result against var.orders, so
+    entries left behind when var.orders is cleared are ignored.
+
+    levels holds the remaining quantity of resting orders of all bots by
+    (symbol, side, price). sides holds the orders of each bot by (symbol,
+    side) in the same order as var.orders[emi]. reindex_order() must be
+    called after the price, side or leavesQty of an order changes.
+    """
+
+    emi = dict()  # clOrdID: emi
+    clOrdID = dict()  # orderID: clOrdID
+    levels = dict()  # (symbol, side, price): {clOrdID: leavesQty}
+    level = dict()  # clOrdID: (symbol, side, price) key in levels
+    sides = dict()  # emi: {(symbol, side): OrderedDict(clOrdID: sequence)}
+    side = dict()  # clOrdID: (emi, (symbol, side)) key in sides
+    sequence = 0
+
+
+def _remove_level(clOrdID: str) -> None:
+    key = OrderIndex.level.pop(clOrdID, None)
+    if key is not None:
+        orders = OrderIndex.levels.get(key)
+        if orders is not None:
+            orders.pop(clOrdID, None)
+            if not orders:
+                del OrderIndex.levels[key]
+
+
+def _remove_side(clOrdID: str) -> None:
+    key = OrderIndex.side.pop(clOrdID, None)
+    if key is not None:
+        orders = OrderIndex.sides.get(key[0], {}).get(key[1])
+        if orders is not None:
+            orders.pop(clOrdID, None)
+
+
+def _add_side(emi: str, clOrdID: str, key: tuple) -> None:
+    if emi not in OrderIndex.sides:
+        OrderIndex.sides[emi] = dict()
+    if key not in OrderIndex.sides[emi]:
+        OrderIndex.sides[emi][key] = OrderedDict()
+    OrderIndex.sequence += 1
+    OrderIndex.sides[emi][key][clOrdID] = OrderIndex.sequence
+    OrderIndex.sides[emi][key].move_to_end(clOrdID)
+    OrderIndex.side[clOrdID] = (emi, key)
+
+
+def reindex_order(emi: str, clOrdID: str, move: bool = False) -> None:
+    """
+    Updates the price level and side indexes after the order has changed
+    or has been removed from var.orders. If move is True, the order is also
+    moved to the end of its side, as var.orders[emi].move_to_end() does.
+    """
+    _remove_level(clOrdID)
+    orders = var.orders.get(emi)
+    if orders is not None and clOrdID in orders:
+        order = orders[clOrdID]
+        key = (order["symbol"], order["side"], order["price"])
+        if key not in OrderIndex.levels:
+            OrderIndex.levels[key] = dict()
+        OrderIndex.levels[key][clOrdID] = order["leavesQty"]
+        OrderIndex.level[clOrdID] = key
+        key = (order["symbol"], order["side"])
+        if OrderIndex.side.get(clOrdID) != (emi, key):
+            _remove_side(clOrdID)
+            _add_side(emi=emi, clOrdID=clOrdID, key=key)
+        elif move:
+            _add_side(emi=emi, clOrdID=clOrdID, key=key)
+    else:
+        _remove_side(clOrdID)
+
+
+def side_orders(emi: str, symbol: tuple, side: str = "") -> list:
+    """
+    Returns the orders of the bot for the symbol in the order of
+    var.orders[emi]. If side is omitted, the orders of both sides are
+    merged.
+    """
+    bot_sides = OrderIndex.sides.get(emi)
+    if not bot_sides:
+        return []
+    orders = var.orders.get(emi, {})
+    res = list()
+    for sd in (side,) if side else ("Buy", "Sell"):
+        clOrdIDs = bot_sides.get((symbol, sd))
+        if clOrdIDs:
+            res.append(
+                [
+                    (sequence, orders[clOrdID])
+                    for clOrdID, sequence in list(clOrdIDs.items())
+                    if clOrdID in orders
+                ]
+            )
+    if len(res) == 1:
+        return [order for _, order in res[0]]
+
+    return [order for _, order in heapq.merge(*res, key=lambda x: x[0])]
+
+
+def level_qty(symbol: tuple, price: float, side: str = "") -> float:
+    """
+    Returns the remaining quantity of all resting orders at the price. If
+    side is omitted, both sides are summed up.
+    """
+    qty = 0
+    for sd in (side,) if side else ("Buy", "Sell"):
+        orders = OrderIndex.levels.get((symbol, sd, price))
+        if orders:
+            qty += sum(list(orders.values()))
+
+    return qty
+
+
+def get_order(clOrdID: str) -> tuple:
+    """
+    Returns (emi, order) for the clOrdID or (None, None) if there is no
+    such order in var.orders.
+    """
+    emi = OrderIndex.emi.get(clOrdID)
+    if emi is not None:
+        orders = var.orders.get(emi)
+        if orders is not None and clOrdID in orders:
+            return emi, orders[clOrdID]
+        OrderIndex.emi.pop(clOrdID, None)
+
+    return None, None
+
+
+def get_order_by_id(orderID: str) -> tuple:
+    """
+    Returns (emi, clOrdID) of the order with the orderID assigned by the
+    exchange or (None, None) if there is no such order in var.orders.
+    """
+    clOrdID = OrderIndex.clOrdID.get(orderID)
+    if clOrdID is not None:
+        emi, order = get_order(clOrdID)
+        if order is not None and order["orderID"] == orderID:
+            return emi, clOrdID
+        OrderIndex.clOrdID.pop(orderID, None)
+
+    return None, None
+
+
+def update_order_id(emi: str, clOrdID: str, orderID: str) -> None:
+    """
+    Sets a new orderID of the order, for example after it was replaced.
+    """
+    order = var.orders[emi][clOrdID]
+    if OrderIndex.clOrdID.get(order["orderID"]) == clOrdID:
+        del OrderIndex.clOrdID[order["orderID"]]
+    order["orderID"] = orderID
+    OrderIndex.clOrdID[orderID] = clOrdID
+
+
+def remove_order(emi: str, clOrdID: str) -> None:
+    """
+    Deletes the order from var.orders and from the index.
+    """
+    order = var.orders[emi].pop(clOrdID)
+    _remove_level(clOrdID)
+    _remove_side(clOrdID)
+    if OrderIndex.emi.get(clOrdID) == emi:
+        del OrderIndex.emi[clOrdID]
+    if OrderIndex.clOrdID.get(order.get("orderID")) == clOrdID:
+        del OrderIndex.clOrdID[order["orderID"]]
+
+
+def clear_order_index() -> None:
+    OrderIndex.emi = dict()
+    OrderIndex.clOrdID = dict()
+    OrderIndex.levels = dict()
+    OrderIndex.level = dict()
+    OrderIndex.sides = dict()
+    OrderIndex.side = dict()
 
 
 def fill_bot_position(
@@ -405,26 +1108,16 @@ def fill_bot_position(
         bot.bot_positions[symbol]["position"] = var.DASH
     # Checks if this bot has any records in the database on this instrument.
     if not var.backtest:
-        qwr = (
-            "select MARKET, SYMBOL, sum(abs(QTY)) as SUM_QTY, "
-            + "sum(SUMREAL) as SUM_SUMREAL, sum(COMMISS) as "
-            + "SUM_COMMISS, TTIME from (select * from "
-            + var.database_table
-            + " where EMI = '"
-            + bot_name
-            + "' and SYMBOL = '"
-            + instrument.symbol
-            + "' and MARKET = '"
-            + instrument.market
-            + "' and ACCOUNT = "
-            + str(user_id)
-            + " and SIDE <> 'Fund' order by ID desc) T;"
+        data = ledger_totals(
+            account=user_id,
+            market=instrument.market,
+            emi=bot_name,
+            symbol=instrument.symbol,
         )
-        data = select_database(qwr)[0]
-        if data and data["SUM_QTY"]:
-            bot.bot_positions[symbol]["volume"] = float(data["SUM_QTY"])
-            bot.bot_positions[symbol]["sumreal"] = float(data["SUM_SUMREAL"])
-            bot.bot_positions[symbol]["commiss"] = float(data["SUM_COMMISS"])
+        if data and data[()]["volume"]:
+            bot.bot_positions[symbol]["volume"] = float(data[()]["volume"])
+            bot.bot_positions[symbol]["sumreal"] = float(data[()]["sumreal"])
+            bot.bot_positions[symbol]["commiss"] = float(data[()]["commiss"])
 
 
 def timeframe_seconds(timefr: str) -> int:
@@ -445,10 +1138,34 @@ def bot_error(bot: BotData) -> str:
     return error
 
 
-def kline_hi_lo_values(ws, symbol: tuple, instrument: Instrument) -> None:
+class TopOfBook:
+    """
+    Conflation of the order book updates. The websocket threads only call
+    publish_top_of_book(). For the klines it keeps the highest ask and the
+    lowest bid of each symbol since they were last taken with take_hi_lo(),
+    the current kline is updated when it is read or closed, see
+    fold_kline_hi_lo(). For the symbols with indicators it keeps the best
+    ask and bid of every update in order, up to var.indicator_prices per
+    symbol, since a break of the up level followed by a break of the dn
+    level is counted differently from the reverse. They are applied by
+    apply_prices(), called by indicator_update() in functions.py, which
+    waits for the event, and by fold_kline_hi_lo() before the bots read the
+    klines, so that no price is counted against the levels set after it.
+    The latest prices themselves are in Instrument.asks and Instrument.bids.
+    """
+
+    hi_lo = dict()
+    prices = dict()
+    lock = threading.Lock()
+    event = threading.Event()
+    indicator_lock = threading.Lock()
+
+
+def publish_top_of_book(ws, symbol: tuple, instrument: Instrument) -> None:
     """
-    Updates the high and low values of kline data when websocket updates the
-    order book.
+    Called by the websocket thread after the order book of the symbol is
+    updated. Accumulates the high and low prices for the klines and the
+    prices for the indicators and notifies indicator_update().
 
     Parameters
     ----------
@@ -462,39 +1179,86 @@ def kline_hi_lo_values(ws, symbol: tuple, instrument: Instrument) -> None:
     """
 
     if symbol in ws.klines:
-        try:
-            ask = instrument.asks[0][0]
-            bid = instrument.bids[0][0]
-        except Exception:
+        if not instrument.asks.count or not instrument.bids.count:
             """
             The order book is probably empty.
             """
             return
-        for timefr, values in ws.klines[symbol].items():
-            if values["data"]:
-                if ask > values["data"][-1]["hi"]:
-                    values["data"][-1]["hi"] = ask
-                if bid < values["data"][-1]["lo"]:
-                    values["data"][-1]["lo"] = bid
+        ask = instrument.asks.best_price
+        bid = instrument.bids.best_price
+        with TopOfBook.lock:
+            hi_lo = TopOfBook.hi_lo.get(symbol)
+            if hi_lo is None:
+                TopOfBook.hi_lo[symbol] = [ask, bid]
+            else:
+                if ask > hi_lo[0]:
+                    hi_lo[0] = ask
+                if bid < hi_lo[1]:
+                    hi_lo[1] = bid
+            if symbol in BreakDown.symbols:
+                prices = TopOfBook.prices.get(symbol)
+                if prices is None:
+                    prices = deque(maxlen=var.indicator_prices)
+                    TopOfBook.prices[symbol] = prices
+                if not prices or prices[-1] != (ask, bid):
+                    prices.append((ask, bid))
+        if symbol in BreakDown.symbols and not TopOfBook.event.is_set():
+            TopOfBook.event.set()
 
-            # Processing the BreakDown indicator
 
-            if symbol in BreakDown.symbols:
-                if timefr in BreakDown.symbols[symbol]:
-                    for parameters in BreakDown.symbols[symbol][timefr].values():
-                        direct = parameters["first"] * (
-                            parameters["number"] % 2 * 2 - 1
-                        )
-                        if parameters["up"]:
-                            if direct >= 0 and ask > parameters["up"]:
-                                parameters["number"] += 1
-                                if parameters["first"] == 0:
-                                    parameters["first"] = -1
-                        if parameters["dn"]:
-                            if direct <= 0 and bid < parameters["dn"]:
-                                parameters["number"] += 1
-                                if parameters["first"] == 0:
-                                    parameters["first"] = 1
+def take_hi_lo(symbol: tuple) -> Union[list, None]:
+    """
+    Returns [highest ask, lowest bid] of the symbol accumulated since the
+    previous call, None if there were no updates.
+    """
+    with TopOfBook.lock:
+        return TopOfBook.hi_lo.pop(symbol, None)
+
+
+def take_prices(symbol: tuple) -> deque:
+    """
+    Returns (ask, bid) of the updates of the symbol since the previous
+    call, the oldest first.
+    """
+    with TopOfBook.lock:
+        return TopOfBook.prices.pop(symbol, deque())
+
+
+def apply_prices(symbol: tuple) -> None:
+    """
+    Applies the prices accumulated for the indicators of the symbol. The
+    prices taken by one thread are applied before another thread can take
+    the next ones.
+    """
+    with TopOfBook.indicator_lock:
+        for ask, bid in take_prices(symbol=symbol):
+            BreakDown.update(symbol, ask=ask, bid=bid)
+
+
+def clear_hi_lo(market: str) -> None:
+    with TopOfBook.lock:
+        for accumulated in (TopOfBook.hi_lo, TopOfBook.prices):
+            for symbol in list(accumulated):
+                if symbol[1] == market:
+                    del accumulated[symbol]
+
+
+def fold_kline_hi_lo(ws, symbol: tuple) -> None:
+    """
+    Applies the high and low prices accumulated by publish_top_of_book() to
+    the current kline of each timeframe of the symbol and the accumulated
+    prices to its indicators.
+    """
+    if symbol in BreakDown.symbols:
+        apply_prices(symbol=symbol)
+    hi_lo = take_hi_lo(symbol=symbol)
+    if hi_lo and symbol in ws.klines:
+        for values in ws.klines[symbol].values():
+            if values["data"]:
+                if hi_lo[0] > values["data"][-1]["hi"]:
+                    values["data"][-1]["hi"] = hi_lo[0]
+                if hi_lo[1] < values["data"][-1]["lo"]:
+                    values["data"][-1]["lo"] = hi_lo[1]
 
 
 def count_orders():
@@ -738,8 +1502,8 @@ def fill_instrument_index(index: OrderedDict, instrument: Instrument, ws) -> dic
         series.fundingRate = var.DASH
         series.baseCoin = instrument.baseCoin
         series.precision = instrument.precision
-        series.asks = [[var.DASH, var.DASH]]
-        series.bids = [[var.DASH, var.DASH]]
+        series.asks = BookSide()
+        series.bids = BookSide()
         series.price_precision = 1
         series.isInverse = instrument.isInverse
     else:
@@ -10,6 +10,7 @@ from api.api import WS
 from api.setup import Markets
 from backtest import functions as backtest
 from common.data import BotData, Bots, Instrument, MetaInstrument
+from common.klines import KlineStore
 from common.variables import Variables as var
 from display.bot_menu import bot_manager
 from display.messages import ErrorMessage
@@ -174,10 +175,11 @@ class Bot(BotData):
         return filtered
 
     def _backtest_remove(self, clOrdID: str) -> None:
-        del var.orders[self.name][clOrdID]
+        service.remove_order(emi=self.name, clOrdID=clOrdID)
 
     def _backtest_replace(self, clOrdID: str, price: float) -> None:
         var.orders[self.name][clOrdID]["price"] = price
+        service.reindex_order(emi=self.name, clOrdID=clOrdID)
 
 
 class Tool(Instrument):
@@ -213,9 +215,7 @@ class Tool(Instrument):
                 ws = Markets[self.market]
                 clOrdID = None
                 if move is True:
-                    clOrdID = self._get_latest_order(
-                        orders=var.orders[bot.name], side=side
-                    )
+                    clOrdID = self._get_latest_order(bot_name=bot.name, side=side)
                 if clOrdID is None:
                     clOrdID = service.set_clOrdID(emi=bot.name)
                     if side == "Sell":
@@ -244,9 +244,9 @@ class Tool(Instrument):
             self._empty_orderbook(qty=qty, price=price, bot_name=bot.name)
         if cancel:
             if side == "Sell":
-                self._remove_orders(orders=var.orders[bot.name], side="Buy")
+                self._remove_orders(bot_name=bot.name, side="Buy")
             elif side == "Buy":
-                self._remove_orders(orders=var.orders[bot.name], side="Sell")
+                self._remove_orders(bot_name=bot.name, side="Sell")
 
         if isinstance(res, dict):
             return clOrdID
@@ -481,6 +481,39 @@ class Tool(Instrument):
 
         return lambda *args: self._kline(timefr, bot_name, *args)
 
+    def kline_history(self, timefr: str = "") -> KlineStore:
+        """
+        Returns closed klines stored on disk for the instrument. Unlike
+        add_kline(), the history is kept between reboots and is read from
+        the memory-mapped file column by column.
+
+        Parameters
+        ----------
+        timefr: str
+            Time frame, see add_kline(). If omited, the time frame is
+            specified in the bot parameters.
+
+        Returns
+        -------
+        KlineStore
+            The columns are "timestamp", "date", "time", "open_bid",
+            "open_ask", "hi", "lo", "funding".
+
+        Examples
+        --------
+        history = Bybit["BTCUSD"].kline_history()
+
+        history.column("hi", start=-1000)
+        Return type: array
+            Returns the highest prices of the latest 1000 klines.
+        """
+        if timefr == "":
+            timefr = Bots[name(inspect.stack())].timefr
+
+        return functions.Function.kline_store(
+            Markets[self.market], symbol=self.symbol_tuple, timefr=timefr
+        )
+
     def set_limit(self, bot: Bot, limit: float) -> None:
         """
         Limits bot position for the specified instrument.
@@ -563,11 +596,33 @@ class Tool(Instrument):
             the descend parameter. The OrderedDict key is the clOrdID value.
         """
         filtered = self._filter_by_side(
-            orders=var.orders[bot.name], side=side, descend=descend, in_list=in_list
+            bot_name=bot.name, side=side, descend=descend, in_list=in_list
         )
 
         return filtered
 
+    def order_qty(self, price: float, side: str = "") -> float:
+        """
+        Get the remaining quantity of resting orders of all bots for the
+        instrument at the given price.
+
+        Parameters
+        ----------
+        price: float
+            Order price. Rounded to the tick size of the instrument.
+        side: str
+            Optional. The Sell or Buy side of the orders. If the parameter is
+            omitted, both sides are summed up.
+
+        Returns
+        -------
+        float
+            Total leavesQty of the orders, 0 if there are no orders.
+        """
+        price = service.ticksize_rounding(price=price, ticksize=self.tickSize)
+
+        return service.level_qty(symbol=self.symbol_tuple, price=price, side=side)
+
     def _kline(self, timefr, bot_name, *args) -> dict:
         """
         Returns kline (candlestick) data.
@@ -586,6 +641,7 @@ class Tool(Instrument):
         """
         if not var.backtest:
             ws = Markets[self.market]
+            service.fold_kline_hi_lo(ws, symbol=self.symbol_tuple)
             if not args:
                 values = {"data": ws.klines[self.symbol_tuple][timefr]["data"]}
             else:
@@ -617,16 +673,15 @@ class Tool(Instrument):
 
         else:
             bot = Bots[bot_name]
+            data = bot.backtest_data[self.symbol_tuple]
             if not args:
-                values = bot.backtest_data[self.symbol_tuple]
+                values = {"data": data}
+                num = bot.iter + 1
             else:
-                values = bot.backtest_data[self.symbol_tuple][bot.iter + args[0]]
-            values["bid"] = bot.backtest_data[self.symbol_tuple][
-                bot.iter + args[0] + 2
-            ]["open_bid"]
-            values["ask"] = bot.backtest_data[self.symbol_tuple][
-                bot.iter + args[0] + 2
-            ]["open_ask"]
+                values = data[bot.iter + args[0]]
+                num = bot.iter + args[0] + 2
+            values["bid"] = backtest.bar_value(data, num=num, header="open_bid")
+            values["ask"] = backtest.bar_value(data, num=num, header="open_ask")
 
             return values
 
@@ -700,7 +755,7 @@ class Tool(Instrument):
 
     def _filter_by_side(
         self,
-        orders: OrderedDict,
+        bot_name: str,
         side: str = None,
         descend: bool = False,
         in_list: bool = True,
@@ -710,8 +765,8 @@ class Tool(Instrument):
 
         Parameters
         ----------
-        orders: OrderedDict
-            Bot order dictionary, where the key is clOrdID
+        bot_name: str
+            Bot name.
         side: str
             Buy or Sell
         descend: bool
@@ -727,56 +782,40 @@ class Tool(Instrument):
             Orders are sorted by ``transactTime`` in the order specified in
             the descend parameter. The OrderedDict key is the clOrdID value.
         """
-        ord = orders.values()
+        filtered = service.side_orders(
+            emi=bot_name, symbol=self.symbol_tuple, side=side or ""
+        )
+        if descend:
+            filtered.sort(key=lambda x: x["transactTime"], reverse=True)
         if not in_list:
-            filtered = OrderedDict()
-            if descend:
-                ord = sorted(ord, key=lambda x: x["transactTime"], reverse=True)
-            for value in ord:
-                if value["symbol"] == self.symbol_tuple:
-                    if side:
-                        if value["side"] == side:
-                            filtered[value["clOrdID"]] = value
-                    else:
-                        filtered[value["clOrdID"]] = value
-        else:
-            filtered = list()
-            if descend:
-                ord = sorted(ord, key=lambda x: x["transactTime"], reverse=True)
-            for value in ord:
-                if value["symbol"] == self.symbol_tuple:
-                    if side:
-                        if value["side"] == side:
-                            filtered.append(value)
-                    else:
-                        filtered.append(value)
+            filtered = OrderedDict((value["clOrdID"], value) for value in filtered)
 
         return filtered
 
-    def _remove_orders(self, orders: OrderedDict, side: str) -> None:
+    def _remove_orders(self, bot_name: str, side: str) -> None:
         """
         Removes group of given orders by side.
 
         Parameters
         ----------
-        orders: OrderedDict
-            Dictionary where key is clOrdID.
+        bot_name: str
+            Bot name.
         side: str
             Buy or Sell
         """
-        orders = self._filter_by_side(orders=orders, side=side)
+        orders = self._filter_by_side(bot_name=bot_name, side=side)
         ws = Markets[self.market]
         for order in orders:
             WS.remove_order(ws, order=order)
 
-    def _get_latest_order(self, orders: OrderedDict, side: str) -> Union[str, None]:
+    def _get_latest_order(self, bot_name: str, side: str) -> Union[str, None]:
         """
         Finds the last order on a given side.
 
         Parameters
         ----------
-        orders: OrderedDict
-            Dictionary where key is clOrdID.
+        bot_name: str
+            Bot name.
         side: str
             Buy or Sell
 
@@ -785,7 +824,7 @@ class Tool(Instrument):
         str | None
             If an order is found, returns clOrdID of that order, otherwise None.
         """
-        orders = self._filter_by_side(orders=orders, side=side)
+        orders = self._filter_by_side(bot_name=bot_name, side=side)
         if orders:
             return orders[0]["clOrdID"]
 
@@ -831,12 +870,14 @@ class Tool(Instrument):
         if qty != 0:
             price = service.ticksize_rounding(price=price, ticksize=self.tickSize)
             if move is True:
-                clOrdID = self._get_latest_order(orders=var.orders[bot.name], side=side)
+                clOrdID = self._get_latest_order(bot_name=bot.name, side=side)
             data = bot.backtest_data[self.symbol_tuple]
+            open_bid = backtest.bar_value(data, num=bot.iter + 1, header="open_bid")
+            open_ask = backtest.bar_value(data, num=bot.iter + 1, header="open_ask")
             if side == "Sell":
-                compare_2 = data[bot.iter + 1]["open_bid"]
+                compare_2 = open_bid
                 if not price:
-                    price = data[bot.iter + 1]["open_ask"]
+                    price = open_ask
                 else:
                     if price < compare_2:
                         price = compare_2
@@ -844,16 +885,19 @@ class Tool(Instrument):
                     price = compare_2
                 compare_1 = price
             else:
-                compare_1 = data[bot.iter + 1]["open_ask"]
+                compare_1 = open_ask
                 if not price:
-                    price = data[bot.iter + 1]["open_bid"]
+                    price = open_bid
                 else:
                     if price > compare_1:
                         price = compare_1
                 if ordType == "Market":
                     price = compare_1
                 compare_2 = price
-            ttime = int(str(data[bot.iter]["date"]) + str(data[bot.iter]["time"]))
+            ttime = int(
+                str(backtest.bar_value(data, num=bot.iter, header="date"))
+                + str(backtest.bar_value(data, num=bot.iter, header="time"))
+            )
             if compare_1 <= compare_2:
                 clOrdID = backtest._trade(
                     instrument=self,
@@ -883,17 +927,14 @@ class Tool(Instrument):
                     )
                 else:
                     var.orders[bot.name][clOrdID]["price"] = price
+                    service.reindex_order(emi=bot.name, clOrdID=clOrdID)
         if cancel:
             if side == "Sell":
-                orders = self._filter_by_side(
-                    orders=var.orders[bot.name], side="Buy", in_list=False
-                )
+                orders = self._filter_by_side(bot_name=bot.name, side="Buy")
             else:
-                orders = self._filter_by_side(
-                    orders=var.orders[bot.name], side="Sell", in_list=False
-                )
-            for clOrdID in orders:
-                del var.orders[bot.name][clOrdID]
+                orders = self._filter_by_side(bot_name=bot.name, side="Sell")
+            for clOrdID in [order["clOrdID"] for order in orders]:
+                service.remove_order(emi=bot.name, clOrdID=clOrdID)
 
         return clOrdID
 